@@ -0,0 +1,85 @@
+import threading
+import time
+
+from logger import logger
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: предохранитель разомкнут"""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего сервиса.
+
+    После failure_threshold ошибок подряд размыкается и reset_timeout секунд
+    отклоняет запросы сразу. Затем пропускает один пробный запрос (half-open):
+    успех замыкает цепь, ошибка размыкает ее снова.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def allow(self):
+        """True, если запрос можно отправить"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probe = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe:
+                self._probe = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def available(self):
+        """Можно ли ждать ответа, не занимая пробный запрос"""
+        with self._lock:
+            return self.state != OPEN or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def snapshot(self):
+        """Состояние для мониторинга"""
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'retry_in': retry_in,
+            }
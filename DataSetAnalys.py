@@ -5,14 +5,22 @@ import matplotlib.pyplot as plt
 matplotlib.use('Agg')
 import seaborn as sns
 import io
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+import itertools
+import threading
+import weakref
 
+from cache import TTLCache
 
-def load_data_set():
+
+def load_data_set(path='DataSet.csv'):
     encodings = ['windows-1251','cp-1251','iso-8859-1','utf-8']
 
     for encoding in encodings:
         try:
-            df = pd.read_csv('DataSet.csv',sep= ';', encoding=encoding)
+            df = pd.read_csv(path,sep= ';', encoding=encoding)
             print(f"Кодировка : {encoding}")
             break
         except Exception as e:
@@ -24,8 +32,41 @@ def load_data_set():
 
     return df
 
-def get_basic_stats(df):
+# Версии датасетов для ключей кешей
+_versions = {}
+_versions_lock = threading.Lock()
+_version_counter = itertools.count(1)
+
+
+def as_frame(dataset):
+    """DataFrame из хэндла датасета (DatasetRegistry.Dataset) или сам DataFrame"""
+    return dataset if isinstance(dataset, pd.DataFrame) else dataset.frame
+
+
+def dataset_version(df):
+    """Номер версии объекта датасета: у каждого нового DataFrame свой.
+
+    У хэндла из реестра версия своя и не требует загружать данные, поэтому
+    запросы, попавшие в кеш, обходятся без чтения снимка.
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.version
+    with _versions_lock:
+        cached = _versions.get(id(df))
+        # id может достаться новому объекту после сборки мусора, поэтому сверяем ссылку
+        if cached is not None and cached[0]() is df:
+            return cached[1]
+        version = next(_version_counter)
+        _versions[id(df)] = (weakref.ref(df), version)
+    # Запись удаляется вместе с DataFrame. Без блокировки: сборка мусора может
+    # сработать в потоке, который уже держит _versions_lock
+    weakref.finalize(df, _versions.pop, id(df), None)
+    return version
+
+
+def get_basic_stats(dataset):
     """Базовая статистика для подписей"""
+    df = as_frame(dataset)
     stats = {
         'total_players': df['Nick'].nunique(),
         'total_games': df['Game'].nunique(),
@@ -40,14 +81,180 @@ def get_basic_stats(df):
 sns.set_theme(style="whitegrid")
 plt.rcParams['font.family'] = 'DejaVu Sans'
 
-def create_top_games_plot(df):
-    plt.figure(figsize = (12, 8))
-    top_games = df['Game'].value_counts().head(10) #число меняет количество игр в топ-е
+MAX_TOP_GAMES = 50
+MAX_HISTOGRAM_BINS = 100
+
+# Агрегаты (value_counts, гистограммы) и готовые PNG кешируются отдельно:
+# разные варианты графика используют одни и те же агрегаты
+_aggregate_cache = TTLCache(maxsize=256)
+_render_cache = TTLCache(maxsize=64)
+_render_lock = threading.Lock()
+
+# Быстрый режим: Agg-холст напрямую, без seaborn/pyplot и bbox_inches='tight'
+RENDERERS = ('seaborn', 'fast')
+IMAGE_FORMATS = ('png', 'webp', 'svg')
+FAST_DPI = 100
+_fast_figures = {}
+
+def normalize_genre(dataset, genre):
+    """Жанр в написании датасета; None - все жанры, ValueError - такого жанра нет"""
+    if not genre:
+        return None
+    genres = {str(name).lower(): name for name in get_aggregates(dataset, 'genres')}
+    try:
+        return genres[genre.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Жанр {genre} не найден. Доступны: {', '.join(sorted(genres.values()))}")
+
+
+def _aggregate(df, kind, genre=None):
+    if kind == 'genres':
+        return df['Genre'].dropna().unique().astype(str)
+
+    rows = df if genre is None else df[df['Genre'] == genre]
+    if kind == 'game_counts':
+        counts = rows['Game'].value_counts(sort=False)
+        # Словарные колонки снимков считают и игры без единой записи
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(str)
+        # Равные значения - по названию, чтобы топ не зависел от типа колонки
+        return counts.sort_index().sort_values(ascending=False, kind='stable')
+    if kind == 'playtime':
+        return rows['Playtime'].to_numpy(dtype=np.float64)
+    raise ValueError(f"Unknown aggregate {kind}")
+
+
+def get_aggregates(dataset, kind, genre=None):
+    """Агрегаты для графиков из кеша: общие для всех вариантов одного графика"""
+    key = (dataset_version(dataset), kind, genre)
+    value = _aggregate_cache.get(key)
+    if value is None:
+        value = _aggregate(as_frame(dataset), kind, genre)
+        _aggregate_cache.set(key, value)
+    return value
+
+
+def get_playtime_histogram(dataset, bins=20, genre=None, log_scale=False):
+    """Границы и высоты столбцов гистограммы времени игры"""
+    key = (dataset_version(dataset), 'histogram', genre, bins, log_scale)
+    histogram = _aggregate_cache.get(key)
+    if histogram is None:
+        playtime = get_aggregates(dataset, 'playtime', genre)
+        if log_scale:
+            # На логарифмической оси нулевое время не отобразить
+            playtime = playtime[playtime > 0]
+            low, high = (playtime.min(), playtime.max()) if playtime.size else (1.0, 10.0)
+            if low == high:
+                # Одно значение: расширяем диапазон, как histogram_bin_edges делает на линейной шкале
+                low, high = low / 10, high * 10
+            edges = np.geomspace(low, high, bins + 1)
+        else:
+            edges = np.histogram_bin_edges(playtime, bins=bins) if playtime.size else np.array([0.0, 1.0])
+        counts, edges = np.histogram(playtime, bins=edges)
+        histogram = (counts, edges)
+        _aggregate_cache.set(key, histogram)
+    return histogram
+
+
+def _cached_render(key, render):
+    """Картинка из кеша отрисовок; каждый вызов получает свой буфер"""
+    png = _render_cache.get(key)
+    if png is None:
+        # pyplot хранит текущую фигуру глобально, а быстрые фигуры переиспользуются,
+        # поэтому рисуем по одному
+        with _render_lock:
+            png = _render_cache.get(key)
+            if png is None:
+                png = render().getvalue()
+                _render_cache.set(key, png)
+    return io.BytesIO(png)
+
+
+def clear_chart_cache():
+    """Сбрасывает готовые картинки (агрегаты остаются)"""
+    _render_cache.clear()
+
+
+def _check_renderer(renderer, image_format):
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer {renderer}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format {image_format}")
+    if renderer == 'seaborn' and image_format != 'png':
+        raise ValueError("Seaborn renderer supports only png")
+
+
+def _fast_figure(kind, figsize):
+    """Фигура Agg без pyplot; переиспользуется между отрисовками одного графика"""
+    fig = _fast_figures.get(kind)
+    if fig is None:
+        fig = Figure(figsize=figsize, dpi=FAST_DPI)
+        FigureCanvasAgg(fig)
+        _fast_figures[kind] = fig
+    else:
+        fig.clear()
+        fig.set_size_inches(figsize)
+    return fig
+
+
+def _save_fast_figure(fig, image_format):
+    buf = io.BytesIO()
+    if image_format == 'png':
+        # Графики состоят из немногих цветов: палитра сильно уменьшает PNG
+        fig.canvas.draw()
+        image = Image.frombuffer('RGBA', fig.canvas.get_width_height(), fig.canvas.buffer_rgba())
+        image.convert('RGB').quantize(colors=256).save(buf, format='png', optimize=True)
+    elif image_format == 'webp':
+        fig.savefig(buf, format='webp', pil_kwargs={'quality': 85, 'method': 4})
+    else:
+        fig.savefig(buf, format='svg')
+    buf.seek(0)
+    return buf
+
+
+def create_top_games_plot(dataset, top_n=10, genre=None, renderer='seaborn', image_format='png'):
+    _check_renderer(renderer, image_format)
+    top_n = max(1, min(int(top_n), MAX_TOP_GAMES))
+    genre = normalize_genre(dataset, genre)
+    key = (dataset_version(dataset), 'top_games', top_n, genre, renderer, image_format)
+    if renderer == 'fast':
+        return _cached_render(key, lambda: _render_top_games_fast(dataset, top_n, genre, image_format))
+    return _cached_render(key, lambda: _render_top_games(dataset, top_n, genre))
+
+
+def _render_top_games_fast(dataset, top_n, genre, image_format):
+    top_games = get_aggregates(dataset, 'game_counts', genre).head(top_n)
+    height = max(6, top_n * 0.3)
+    fig = _fast_figure('top_games', (10, height))
+    # Поля в дюймах, чтобы подписи не обрезались при любой высоте; слева - под названия игр
+    fig.subplots_adjust(left=0.25, right=0.95, top=1 - 0.5 / height, bottom=0.7 / height)
+    ax = fig.add_subplot()
+
+    positions = np.arange(len(top_games))
+    colors = matplotlib.colormaps['viridis'](np.linspace(0, 1, max(len(top_games), 1)))
+    ax.barh(positions, top_games.values, color=colors)
+    ax.set_yticks(positions, top_games.index)
+    ax.invert_yaxis()
+
+    title = f'ТОП {top_n} игр, в которые играют мои друзья'
+    ax.set_title(title + (f' ({genre})' if genre else ''))
+    ax.set_xlabel('Количество игроков', fontsize=12)
+
+    for i, value in enumerate(top_games.values):
+        ax.text(value + 0.1, i, f'{value}', va='center', fontweight='bold')
+
+    return _save_fast_figure(fig, image_format)
+
+
+def _render_top_games(dataset, top_n, genre):
+    plt.figure(figsize = (12, max(8, top_n * 0.35)))
+    top_games = get_aggregates(dataset, 'game_counts', genre).head(top_n) #число меняет количество игр в топ-е
     ax = sns.barplot(x = top_games.values , y = top_games.index,
                      palette = 'viridis', hue = top_games.index,
                      legend = False, dodge = False)
 
-    plt.title('ТОП 10 игр, в которые играют мои друзья')
+    title = f'ТОП {top_n} игр, в которые играют мои друзья'
+    plt.title(title + (f' ({genre})' if genre else ''))
     plt.xlabel('Количество игроков', fontsize = 12)
     plt.ylabel('')
 
@@ -66,14 +273,50 @@ def create_top_games_plot(df):
     return buf
 
 
-def create_playtime_distribution(df):
+def create_playtime_distribution(dataset, bins=20, genre=None, log_scale=False, renderer='seaborn', image_format='png'):
     """Распределение времени игры"""
+    _check_renderer(renderer, image_format)
+    bins = max(2, min(int(bins), MAX_HISTOGRAM_BINS))
+    genre = normalize_genre(dataset, genre)
+    log_scale = bool(log_scale)
+    key = (dataset_version(dataset), 'playtime', bins, genre, log_scale, renderer, image_format)
+    if renderer == 'fast':
+        return _cached_render(key, lambda: _render_playtime_fast(dataset, bins, genre, log_scale, image_format))
+    return _cached_render(key, lambda: _render_playtime_distribution(dataset, bins, genre, log_scale))
+
+
+def _render_playtime_fast(dataset, bins, genre, log_scale, image_format):
+    # Столбцы рисуем прямо из кешированной гистограммы, без KDE
+    counts, edges = get_playtime_histogram(dataset, bins, genre, log_scale)
+    fig = _fast_figure('playtime', (10, 6))
+    fig.subplots_adjust(left=0.1, right=0.97, top=0.9, bottom=0.1)
+    ax = fig.add_subplot()
+
+    ax.stairs(counts, edges, fill=True, color='skyblue', alpha=0.8)
+    if log_scale:
+        ax.set_xscale('log')
+    title = 'Распределение времени игры' + (f' ({genre})' if genre else '')
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Часы в игре' + (' (логарифмическая шкала)' if log_scale else ''), fontsize=12)
+    ax.set_ylabel('Количество записей', fontsize=12)
+
+    return _save_fast_figure(fig, image_format)
+
+
+def _render_playtime_distribution(dataset, bins, genre, log_scale):
     plt.figure(figsize=(12, 8))
-
-    # Гистограмма с KDE
-    sns.histplot(data=df, x='Playtime', bins=20, kde=True, color='skyblue')
-    plt.title('Распределение времени игры', fontsize=16, fontweight='bold', pad=20)
-    plt.xlabel('Часы в игре', fontsize=12)
+    playtime = get_aggregates(dataset, 'playtime', genre)
+    _, edges = get_playtime_histogram(dataset, bins, genre, log_scale)
+    if log_scale:
+        playtime = playtime[playtime > 0]
+
+    # Гистограмма с KDE; границы столбцов берем из кеша
+    ax = sns.histplot(x=playtime, bins=edges, kde=not log_scale, color='skyblue')
+    if log_scale:
+        ax.set_xscale('log')
+    title = 'Распределение времени игры' + (f' ({genre})' if genre else '')
+    plt.title(title, fontsize=16, fontweight='bold', pad=20)
+    plt.xlabel('Часы в игре' + (' (логарифмическая шкала)' if log_scale else ''), fontsize=12)
     plt.ylabel('Количество записей', fontsize=12)
 
     plt.tight_layout()
@@ -86,8 +329,12 @@ def create_playtime_distribution(df):
     return buf
 
 
-def create_genre_analysis(df):
+def create_genre_analysis(dataset):
     """Анализ по жанрам"""
+    return _cached_render((dataset_version(dataset), 'genres'), lambda: _render_genre_analysis(as_frame(dataset)))
+
+
+def _render_genre_analysis(df):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
 
     # График 1: Круговой график жанров
@@ -118,33 +365,8 @@ def create_genre_analysis(df):
     return buf
 
 
-def create_playtime_distribution(df):
-    """Распределение времени игры"""
-    plt.figure(figsize=(12, 8))
-
-    # Гистограмма с KDE
-    sns.histplot(data=df, x='Playtime', bins=20, kde=True, color='skyblue')
-    plt.title('Распределение времени игры', fontsize=16, fontweight='bold', pad=20)
-    plt.xlabel('Часы в игре', fontsize=12)
-    plt.ylabel('Количество записей', fontsize=12)
-
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-
-    return buf
-
-
-def test_playtime_achievements_correlation(df):
-    """Проверяем корреляцию между временем игры и достижениями"""
-
-    # Корреляция через pandas
-    correlation = df['Playtime'].corr(df['Achievements'])
-
-    # Интерпретация корреляции
+def describe_correlation(correlation):
+    """Интерпретация корреляции: сила и направление связи"""
     if abs(correlation) > 0.7:
         strength = "сильная"
     elif abs(correlation) > 0.5:
@@ -155,12 +377,202 @@ def test_playtime_achievements_correlation(df):
         strength = "очень слабая"
 
     direction = "положительная" if correlation > 0 else "отрицательная"
+    return strength, direction
+
+
+def test_playtime_achievements_correlation(dataset):
+    """Проверяем корреляцию между временем игры и достижениями"""
+    df = as_frame(dataset)
+
+    # Корреляция через pandas
+    correlation = df['Playtime'].corr(df['Achievements'])
+
+    strength, direction = describe_correlation(correlation)
 
-    # Дополнительная проверка через группировку
-    df['Playtime_Group'] = pd.cut(df['Playtime'], bins=5)
-    group_stats = df.groupby('Playtime_Group',observed= False)['Achievements'].agg(['mean', 'count'])
+    # Дополнительная проверка через группировку; датасет общий, поэтому колонку в него не добавляем
+    playtime_group = pd.cut(df['Playtime'], bins=5).rename('Playtime_Group')
+    group_stats = df.groupby(playtime_group,observed= False)['Achievements'].agg(['mean', 'count'])
     return correlation, strength, direction, group_stats
 
-def test_playtime_is_assymetryc(df):
-    playtime = df['Playtime'].skew()
-    return playtime
\ No newline at end of file
+def test_playtime_is_assymetryc(dataset):
+    playtime = as_frame(dataset)['Playtime'].skew()
+    return playtime
+
+
+def compute_dataset_stats(dataset, bins=5):
+    """Все статистики датасета одним проходом по массивам NumPy.
+
+    Заменяет get_basic_stats, test_playtime_achievements_correlation и
+    test_playtime_is_assymetryc: суммы, максимум, центральные моменты и
+    разбиение на группы считаются по одним и тем же массивам, без повторных
+    вызовов pandas. Уникальные строки считает сам столбец: перевод строковых
+    колонок в массив NumPy дороже, чем их хеширование. Результаты совпадают
+    с pandas-версиями.
+    """
+    df = as_frame(dataset)
+    playtime = df['Playtime'].to_numpy()
+    x = playtime.astype(np.float64, copy=False)
+    y = df['Achievements'].to_numpy(dtype=np.float64)
+
+    valid_x = ~np.isnan(x)
+    if not valid_x.all():
+        playtime, x = playtime[valid_x], x[valid_x]
+    n = x.size
+
+    total = playtime.sum()
+    mean = x.sum() / n if n else np.nan
+
+    # Центральные моменты времени игры: отклонения считаем один раз
+    dx = x - mean
+    dx2 = dx * dx
+    m2 = dx2.sum()
+    m3 = dx2 @ dx
+    if n < 3:
+        skew = np.nan
+    elif m2 == 0:
+        skew = 0.0
+    else:
+        skew = (n * (n - 1) ** 0.5 / (n - 2)) * (m3 / m2 ** 1.5)
+
+    # Корреляция по парам без пропусков (как Series.corr)
+    x_full = df['Playtime'].to_numpy(dtype=np.float64)
+    pair = ~(np.isnan(x_full) | np.isnan(y))
+    if pair.all():
+        px, py = dx, y
+    else:
+        px, py = x_full[pair], y[pair]
+        px = px - px.mean()
+    py = py - py.mean() if py.size else py
+    correlation = (px @ py) / np.sqrt((px @ px) * (py @ py)) if py.size > 1 else np.nan
+
+    # Группы времени игры как в pd.cut(bins=5): равные интервалы, левая граница сдвинута на 0.1%
+    mn, mx = x.min(), x.max()
+    if mn == mx:
+        mn -= 0.001 * abs(mn) if mn != 0 else 0.001
+        mx += 0.001 * abs(mx) if mx != 0 else 0.001
+        edges = np.linspace(mn, mx, bins + 1)
+    else:
+        edges = np.linspace(mn, mx, bins + 1)
+        edges[0] -= (mx - mn) * 0.001
+    groups = np.searchsorted(edges, x_full, side='left') - 1
+    in_range = pair & (groups >= 0) & (groups < bins)
+    counts = np.bincount(groups[in_range], minlength=bins)
+    sums = np.bincount(groups[in_range], weights=y[in_range], minlength=bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_means = sums / counts
+    intervals = pd.cut(np.array([], dtype=np.float64), edges).categories
+    group_stats = pd.DataFrame({'mean': group_means, 'count': counts},
+                               index=pd.CategoricalIndex(intervals, categories=intervals,
+                                                         ordered=True, name='Playtime_Group'))
+
+    return {
+        'total_players': df['Nick'].nunique(),
+        'total_games': df['Game'].nunique(),
+        'total_genres': df['Genre'].nunique(),
+        'total_hours': total,
+        'avg_playtime': mean,
+        'max_playtime': playtime.max(),
+        'correlation': correlation,
+        'skew': skew,
+        'group_stats': group_stats,
+    }
+
+
+def get_dataset_stats(dataset):
+    """compute_dataset_stats из кеша: один расчет на версию датасета"""
+    key = (dataset_version(dataset), 'stats')
+    stats = _aggregate_cache.get(key)
+    if stats is None:
+        stats = compute_dataset_stats(dataset)
+        _aggregate_cache.set(key, stats)
+    return stats
+
+
+# Индексы для запросов по игроку и по игре: строятся один раз на версию датасета
+_index_cache = TTLCache(maxsize=8)
+
+
+def _group_slices(keys, uniques):
+    """Границы подряд идущих одинаковых кодов в отсортированном массиве кодов"""
+    if len(keys) == 0:
+        return {}
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    bounds = np.concatenate(([0], starts, [len(keys)]))
+    # Код -1 - пропуск в колонке, по нему не ищут
+    return {uniques[keys[start]]: (int(start), int(stop))
+            for start, stop in zip(bounds[:-1], bounds[1:]) if keys[start] >= 0}
+
+
+def _sorted_by(df, column):
+    """Порядок строк по column без учета регистра и по убыванию времени игры.
+
+    Ключи группировки берутся в нижнем регистре, чтобы Bob и bob попали в
+    один срез, а не перезаписали друг друга в индексе. Хранятся только номера
+    строк: сами строки берутся из датасета при запросе.
+    """
+    codes, uniques = pd.factorize(df[column].astype(str).str.lower().where(df[column].notna()), sort=True)
+    playtime = df['Playtime'].to_numpy(dtype=np.float64)
+    order = np.lexsort((-playtime, codes))
+    return order.astype(np.min_scalar_type(max(len(df) - 1, 0))), _group_slices(codes[order], list(uniques))
+
+
+def build_indexes(df):
+    """Индексы ник -> срез порядка строк и игра -> срез, внутри среза по убыванию Playtime"""
+    nick_order, nicks = _sorted_by(df, 'Nick')
+    game_order, games = _sorted_by(df, 'Game')
+    return {
+        'nick_order': nick_order,
+        'nicks': nicks,
+        'game_order': game_order,
+        'games': games,
+    }
+
+
+def _rows(dataset, order, bounds):
+    return as_frame(dataset).take(order[bounds[0]:bounds[1]]).reset_index(drop=True)
+
+
+def release_dataset(dataset):
+    """Забывает индексы и копии колонок выгруженного датасета; готовые картинки и статистика остаются"""
+    version = dataset_version(dataset)
+    _index_cache.discard(lambda key: key == version)
+    _aggregate_cache.discard(lambda key: key[0] == version and key[1] == 'playtime')
+
+
+def get_indexes(dataset):
+    """Индексы датасета из кеша; строятся при первом запросе"""
+    version = dataset_version(dataset)
+    indexes = _index_cache.get(version)
+    if indexes is None:
+        indexes = build_indexes(as_frame(dataset))
+        _index_cache.set(version, indexes)
+    return indexes
+
+
+def get_player_stats(dataset, nick):
+    """Игры друга по убыванию времени; None, если ника нет в датасете"""
+    indexes = get_indexes(dataset)
+    bounds = indexes['nicks'].get(nick.strip().lower())
+    if bounds is None:
+        return None
+    return _rows(dataset, indexes['nick_order'], bounds)
+
+
+def find_game(dataset, name):
+    """Название игры из датасета: точное совпадение без учета регистра, иначе по подстроке"""
+    games = get_indexes(dataset)['games']
+    key = name.strip().lower()
+    if key in games:
+        return key
+    # Перебираем уникальные названия, а не строки датасета
+    matches = sorted((game for game in games if key in game), key=len)
+    return matches[0] if matches else None
+
+
+def get_game_players(dataset, name):
+    """Друзья, играющие в игру, по убыванию времени; None, если игры нет"""
+    indexes = get_indexes(dataset)
+    key = find_game(dataset, name)
+    if key is None:
+        return None
+    return _rows(dataset, indexes['game_order'], indexes['games'][key])
@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from DataSetAnalys import load_data_set, release_dataset
+from logger import logger
+
+# Строковые колонки хранятся словарем: коды строк + уникальные значения
+ENCODED_COLUMNS = ('Nick', 'Game', 'Genre')
+NUMERIC_COLUMNS = ('Playtime', 'Achievements')
+META_FILE = 'meta.json'
+
+
+def snapshot_name(csv_path):
+    """Имя снимка зависит от размера и времени изменения CSV: новый файл - новый снимок"""
+    stat = os.stat(csv_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def write_snapshot(df, directory):
+    """Раскладывает датасет по колонкам в .npy-файлы в папке directory.
+
+    Снимок собирается во временной папке и переименовывается целиком, поэтому
+    несколько процессов могут конвертировать один CSV одновременно: читатели
+    видят либо готовый снимок, либо никакого.
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for column in ENCODED_COLUMNS:
+            # Коды в том же типе, что выбирает pandas, чтобы Categorical не копировал их при загрузке
+            # Пропуски остаются пропусками: код -1
+            categorical = pd.Categorical(df[column])
+            np.save(os.path.join(tmp, f"{column}.codes.npy"), categorical.codes)
+            np.save(os.path.join(tmp, f"{column}.dict.npy"), categorical.categories.astype(str).to_numpy(dtype=str))
+        for column in NUMERIC_COLUMNS:
+            np.save(os.path.join(tmp, f"{column}.npy"), df[column].to_numpy())
+        with open(os.path.join(tmp, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'rows': len(df), 'columns': list(df.columns)}, f)
+        os.rename(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # Снимок уже записал другой процесс
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            raise
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def read_snapshot(directory):
+    """DataFrame поверх отображенных в память .npy: числа и коды строк не копируются"""
+    columns = {}
+    for column in ENCODED_COLUMNS:
+        codes = np.load(os.path.join(directory, f"{column}.codes.npy"), mmap_mode='r')
+        categories = np.load(os.path.join(directory, f"{column}.dict.npy"))
+        columns[column] = pd.Categorical.from_codes(codes, categories=categories, validate=False)
+    for column in NUMERIC_COLUMNS:
+        columns[column] = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+    return pd.DataFrame(columns, copy=False)
+
+
+class Dataset:
+    """Хэндл датасета: имя, версия для кешей и лениво загружаемый DataFrame.
+
+    Версия стабильна между выгрузками и процессами, поэтому готовые графики и
+    агрегаты не пересчитываются после повторной загрузки снимка.
+    """
+
+    def __init__(self, name, directory, registry=None):
+        self.name = name
+        self.directory = directory
+        self.version = ('snapshot', name, os.path.basename(directory))
+        with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._registry = registry
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    @property
+    def loaded(self):
+        return self._frame is not None
+
+    @property
+    def frame(self):
+        frame = self._frame
+        if frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = read_snapshot(self.directory)
+                    logger.info(f"Датасет {self.name} загружен ({self.rows} строк)")
+                frame = self._frame
+        if self._registry is not None:
+            self._registry.touch(self)
+        return frame
+
+    def unload(self):
+        # Уже выданные DataFrame продолжают работать: отображение живет, пока на него есть ссылки
+        with self._lock:
+            self._frame = None
+        # Индексы и копии колонок в кешах DataSetAnalys тоже занимают память процесса
+        release_dataset(self)
+
+    def __repr__(self):
+        return f"Dataset({self.name!r}, rows={self.rows})"
+
+
+class DatasetRegistry:
+    """Набор датасетов по имени: CSV из папки превращаются в колоночные снимки.
+
+    Снимки лежат в snapshot_dir и читаются через mmap в режиме только для
+    чтения, так что страницы делят все процессы бота. В памяти процесса
+    одновременно загружено не больше max_loaded датасетов, остальные
+    выгружаются по LRU.
+    """
+
+    def __init__(self, directory='datasets', snapshot_dir=None, max_loaded=8):
+        self.directory = directory
+        self.snapshot_dir = snapshot_dir or os.path.join(directory, '.snapshots')
+        self.max_loaded = max_loaded
+        self._sources = {}
+        self._datasets = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.discover()
+
+    def discover(self):
+        """Регистрирует все CSV из папки реестра под именами файлов"""
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.lower().endswith('.csv'):
+                self.add(os.path.splitext(file_name)[0], os.path.join(self.directory, file_name))
+
+    def add(self, name, csv_path):
+        with self._lock:
+            self._sources[name] = csv_path
+
+    def names(self):
+        with self._lock:
+            return sorted(self._sources)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._sources
+
+    def get(self, name):
+        """Хэндл датасета; при изменении CSV снимок пересобирается. KeyError - нет такого"""
+        with self._lock:
+            csv_path = self._sources[name]
+            dataset = self._datasets.get(name)
+        directory = os.path.join(self.snapshot_dir, name, snapshot_name(csv_path))
+        if dataset is not None and dataset.directory == directory:
+            return dataset
+
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            logger.info(f"Снимок датасета {name} из {csv_path}")
+            write_snapshot(load_data_set(csv_path), directory)
+            self._remove_old_snapshots(name, keep=directory)
+
+        dataset = Dataset(name, directory, registry=self)
+        with self._lock:
+            previous = self._datasets.get(name)
+            self._datasets[name] = dataset
+            if previous is not None:
+                self._loaded.pop(previous, None)
+        if previous is not None:
+            previous.unload()
+        return dataset
+
+    def _remove_old_snapshots(self, name, keep):
+        root = os.path.join(self.snapshot_dir, name)
+        for entry in os.listdir(root):
+            path = os.path.join(root, entry)
+            if path != keep and not entry.startswith('.'):
+                # Открытые mmap других процессов на Linux переживут удаление файлов
+                shutil.rmtree(path, ignore_errors=True)
+
+    def touch(self, dataset):
+        """Отмечает использование загруженного датасета и выгружает самые давние"""
+        evicted = []
+        with self._lock:
+            self._loaded[dataset] = True
+            self._loaded.move_to_end(dataset)
+            while len(self._loaded) > self.max_loaded:
+                evicted.append(self._loaded.popitem(last=False)[0])
+        for old in evicted:
+            old.unload()
+            logger.info(f"Датасет {old.name} выгружен")
+
+    def loaded(self):
+        with self._lock:
+            return [dataset.name for dataset in self._loaded]
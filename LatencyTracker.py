@@ -0,0 +1,82 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Скользящее окно задержек одного endpoint и таймаут по его p99.
+
+    Пока замеров меньше min_samples, используется default_timeout. Таймауты
+    тоже попадают в окно (как задержка, равная таймауту), поэтому при
+    замедлении сервиса p99 и таймаут растут сами, а не режут все запросы.
+    """
+
+    def __init__(self, window=200, min_samples=20, default_timeout=10.0,
+                 min_timeout=1.0, max_timeout=10.0, multiplier=2.0):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q):
+        """q-й перцентиль окна или None, если замеров мало"""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def timeout(self):
+        p99 = self.percentile(99)
+        if p99 is None:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.multiplier))
+
+    def snapshot(self):
+        """Состояние для мониторинга"""
+        return {
+            'samples': len(self.samples),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'timeout': self.timeout(),
+        }
+
+
+class HedgeBudget:
+    """Бюджет повторных (hedged) запросов: не больше ratio от обычных.
+
+    Каждый обычный запрос добавляет ratio жетона, повторный тратит целый;
+    запас ограничен burst, чтобы после тишины не выстрелить пачкой.
+    """
+
+    def __init__(self, ratio=0.05, burst=5):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self.hedged = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedged += 1
+                return True
+            self.denied += 1
+            return False
+
+    def snapshot(self):
+        with self._lock:
+            return {'tokens': round(self.tokens, 2), 'hedged': self.hedged, 'denied': self.denied}
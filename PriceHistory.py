@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from logger import logger
+
+# Колонки наблюдений цены: в каждой партиции по файлу на колонку
+COLUMNS = {
+    'timestamp': np.dtype('<i8'),
+    'appid': np.dtype('<u4'),
+    'region': np.dtype('S2'),
+    'final': np.dtype('<i8'),
+    'initial': np.dtype('<i8'),
+    'discount': np.dtype('u1'),
+}
+# Результат history(): колонки, собранные обратно в записи
+RECORD_DTYPE = np.dtype(list(COLUMNS.items()))
+# Новые строки копятся в буферах открытых файлов и сбрасываются на диск пачкой
+FLUSH_ROWS = 64
+FLUSH_INTERVAL = 5
+
+
+def partition_name(timestamp):
+    """Папка-партиция по месяцу наблюдения (UTC)"""
+    return time.strftime('%Y-%m', time.gmtime(timestamp))
+
+
+class PriceHistory:
+    """Append-only колоночное хранилище наблюдаемых цен Steam.
+
+    Наблюдения пишутся в помесячные папки, в каждой по файлу фиксированной
+    ширины на колонку. Индекс appid -> строки в каждой партиции строится при
+    открытии по одной колонке appid и пополняется при записи, а запросы по
+    игре читают только нужные строки нужных колонок.
+
+    Файлы колонок текущей партиции держатся открытыми, а записи сбрасываются
+    на диск раз в FLUSH_ROWS строк или FLUSH_INTERVAL секунд, поэтому record()
+    на пути ответа пользователю обычно не делает системных вызовов. Перед
+    чтением буферы сбрасываются, close() дописывает остаток при завершении.
+    """
+
+    def __init__(self, directory='price_history'):
+        self.directory = directory
+        self._index = {}
+        self._rows = {}
+        self._maps = {}
+        self._files = {}
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            if os.path.isdir(self._path(name)):
+                self._load_partition(name)
+
+    def _path(self, partition, column=None):
+        path = os.path.join(self.directory, partition)
+        return path if column is None else os.path.join(path, column + '.bin')
+
+    def _load_partition(self, partition):
+        # Строка считается записанной, только если она есть во всех колонках:
+        # недописанные хвосты после сбоя не читаем
+        rows = min((os.path.getsize(self._path(partition, column)) // dtype.itemsize
+                    if os.path.exists(self._path(partition, column)) else 0)
+                   for column, dtype in COLUMNS.items())
+        self._rows[partition] = rows
+        if not rows:
+            return
+
+        appids = self._column(partition, 'appid')
+        order = np.argsort(appids, kind='stable')
+        unique, starts = np.unique(appids[order], return_index=True)
+        for appid, rows_of_app in zip(unique.tolist(), np.split(order, starts[1:])):
+            self._index.setdefault(appid, {})[partition] = rows_of_app.tolist()
+
+    def _column(self, partition, column):
+        rows_total = self._rows[partition]
+        cached = self._maps.get((partition, column))
+        if cached is None or cached.shape[0] != rows_total:
+            cached = np.memmap(self._path(partition, column), dtype=COLUMNS[column], mode='r', shape=(rows_total,))
+            self._maps[(partition, column)] = cached
+        return cached
+
+    def _records(self, partition, rows, region=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        if region is not None:
+            rows = rows[self._column(partition, 'region')[rows] == region]
+        records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+        for column in COLUMNS:
+            records[column] = self._column(partition, column)[rows]
+        return records
+
+    def record(self, appid, region_code, price_overview, timestamp=None):
+        """Добавляет наблюдение price_overview из appdetails"""
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        values = {
+            'timestamp': timestamp,
+            'appid': int(appid),
+            'region': region_code.encode('ascii'),
+            'final': price_overview.get('final', 0),
+            'initial': price_overview.get('initial', price_overview.get('final', 0)),
+            'discount': price_overview.get('discount_percent', 0),
+        }
+
+        partition = partition_name(timestamp)
+        with self._lock:
+            files = self._open_partition(partition)
+            for column, dtype in COLUMNS.items():
+                files[column].write(np.array(values[column], dtype=dtype).tobytes())
+            rows = self._rows.get(partition, 0)
+            self._rows[partition] = rows + 1
+            self._index.setdefault(int(appid), {}).setdefault(partition, []).append(rows)
+
+            self._pending += 1
+            if self._pending >= FLUSH_ROWS or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _open_partition(self, partition):
+        """Файлы колонок партиции для дозаписи, открываются один раз"""
+        files = self._files.get(partition)
+        if files is not None:
+            return files
+
+        # Пишется только текущий месяц: файлы прошлой партиции больше не нужны
+        self._close_files()
+        os.makedirs(self._path(partition), exist_ok=True)
+        rows = self._rows.get(partition, 0)
+        files = {}
+        for column, dtype in COLUMNS.items():
+            f = open(self._path(partition, column), 'ab')
+            # Выравниваем колонку по числу строк, если прошлый раз запись оборвалась
+            f.truncate(rows * dtype.itemsize)
+            files[column] = f
+        self._files[partition] = files
+        return files
+
+    def _flush(self):
+        for files in self._files.values():
+            for f in files.values():
+                f.flush()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def _close_files(self):
+        self._flush()
+        for files in self._files.values():
+            for f in files.values():
+                f.close()
+        self._files.clear()
+
+    def close(self):
+        """Дописывает буферы на диск и закрывает файлы"""
+        with self._lock:
+            self._close_files()
+
+    def history(self, appid, region_code=None):
+        """Все наблюдения по игре, упорядоченные по времени"""
+        region = region_code.encode('ascii') if region_code is not None else None
+        with self._lock:
+            if self._pending:
+                self._flush()
+            partitions = {partition: list(rows) for partition, rows in self._index.get(int(appid), {}).items()}
+            chunks = [self._records(partition, rows, region) for partition, rows in sorted(partitions.items())]
+
+        if not chunks:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        records = np.concatenate(chunks)
+        return records[np.argsort(records['timestamp'], kind='stable')]
+
+    def summary(self, appid):
+        """Сводка по регионам: минимальная цена, текущая цена и частота скидок"""
+        records = self.history(appid)
+        result = {}
+        for region in np.unique(records['region']):
+            observed = records[records['region'] == region]
+            lowest = observed[np.argmin(observed['final'])]
+            days = observed['timestamp'] // 86400
+            discounted_days = np.unique(days[observed['discount'] > 0])
+            result[region.decode('ascii')] = {
+                'observations': len(observed),
+                'lowest_final': int(lowest['final']),
+                'lowest_at': int(lowest['timestamp']),
+                'current_final': int(observed[-1]['final']),
+                'current_discount': int(observed[-1]['discount']),
+                'max_discount': int(observed['discount'].max()),
+                'days_observed': len(np.unique(days)),
+                'days_discounted': len(discounted_days),
+            }
+        return result
+
+    def safe_record(self, appid, region_code, price_overview):
+        """Запись, которая не ломает основной запрос при ошибке хранилища"""
+        try:
+            self.record(appid, region_code, price_overview)
+        except Exception as e:
+            logger.error(f"Price history error for {appid} in region {region_code}: {e}")
@@ -1,12 +1,93 @@
+import re
 import requests
 import json
-
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache import TTLCache
+from CircuitBreaker import CircuitBreaker, CircuitOpenError
+from LatencyTracker import HedgeBudget, LatencyTracker
 from logger import logger
 
+# Карточки игр размечены MarkdownV2: в нем можно экранировать любой символ
+CARD_PARSE_MODE = 'MarkdownV2'
+# Лимиты Telegram: подпись к фото и обычное сообщение
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+# Потолок для коротких полей карточки (название, разработчики, издатели, жанры, цена, дата)
+CARD_FIELD_LIMIT = 80
+# Сколько appid отправлять в одном запросе цен
+PRICE_BATCH_SIZE = 50
+# Предохранитель: ошибок подряд до размыкания и пауза до пробного запроса, с
+BREAKER_FAILURES = 5
+BREAKER_RESET = 30
+# Повторные запросы appdetails: доля от обычных и потоки под параллельные попытки.
+# Одновременно appdetails вызывают потоки telebot (2), предзагрузка (4), инлайн (5)
+# и проверка скидок (1); у каждого вызова может быть вторая попытка
+HEDGE_RATIO = 0.05
+HEDGE_CALLERS = 12
+HEDGE_WORKERS = HEDGE_CALLERS * 2
+
+_MARKDOWN_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+
+# Шаблон карточки: статичные части уже экранированы, подставляются готовые поля
+CARD_TEMPLATE = (
+    "🎮 *{name}*\n"
+    "\n"
+    "{price}\n"
+    "{release_info}\n"
+    "{metacritic_score}\n"
+    "🌍 Регион: {region}\n"
+    "\n"
+    "*Разработчик:* {developers}\n"
+    "*Издатель:* {publishers}\n"
+    "*Жанры:* {genres}\n"
+    "\n"
+    "📖 *Описание:*\n"
+    "{description}\n"
+    "\n"
+    "[Открыть в Steam](https://store.steampowered.com/app/{appid})"
+)
+
+
+def escape_markdown(text):
+    """Экранирует спецсимволы MarkdownV2"""
+    return _MARKDOWN_SPECIAL.sub(r'\\\1', str(text))
+
+
+def _utf16_len(text):
+    # Telegram считает длину в UTF-16: эмодзи занимают две позиции
+    return len(text.encode('utf-16-le')) // 2
+
+
+def truncate_markdown(text, limit):
+    """Экранирует текст и обрезает его так, чтобы результат занимал не больше limit"""
+    escaped = escape_markdown(text)
+    if _utf16_len(escaped) <= limit:
+        return escaped
+
+    ellipsis = escape_markdown("...")
+    budget = limit - _utf16_len(ellipsis)
+    parts = []
+    for char in text:
+        piece = escape_markdown(char)
+        budget -= _utf16_len(piece)
+        if budget < 0:
+            break
+        parts.append(piece)
+    return "".join(parts).rstrip() + ellipsis if parts else ""
+
+
+def _is_steam_failure(response):
+    """5xx и 429 - сбой Steam, а не ответ на запрос"""
+    return response.status_code >= 500 or response.status_code == 429
+
 
 # Класс для работы с Steam API
 class SteamAPI:
-    def __init__(self):
+    def __init__(self, price_history=None, hedge_appdetails=False):
         self.base_url = "https://store.steampowered.com/api"
         self.game_aliases = {
             'ведьмак': 'The Witcher',
@@ -51,41 +132,167 @@ class SteamAPI:
             'BR': {'cc': 'br', 'l': 'russian', 'currency': 'BRL'}
         }
 
+        # Готовые карточки игр и недавние ответы appdetails (цены живут 10 минут)
+        # Просроченные ответы остаются в кеше и отдаются, пока Steam недоступен
+        self.card_cache = TTLCache(maxsize=512)
+        self.details_cache = TTLCache(maxsize=1024, ttl=600, keep_stale=True)
+        # Последние успешные результаты поиска - только на время недоступности Steam
+        self.search_fallback = TTLCache(maxsize=512)
+        # Предохранители по (endpoint, регион)
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        # Задержки по endpoint; пакетные запросы цен тяжелее и считаются отдельно
+        self.latency = {name: LatencyTracker() for name in ('storesearch', 'appdetails', 'appdetails_prices')}
+        # hedge_appdetails: если appdetails отвечает дольше p95, отправляется второй запрос
+        self.hedge_appdetails = hedge_appdetails
+        self.hedge_budget = HedgeBudget(ratio=HEDGE_RATIO)
+        self._hedge_pool = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix='steam-hedge')
+        # Хранилище истории цен (PriceHistory), пополняется каждым ответом appdetails
+        self.price_history = price_history
+
     def get_region_params(self, region_code):
         """Получает параметры для региона"""
         return self.region_settings.get(region_code, self.region_settings['RU'])
 
-    def search_game(self, game_name, region_code='RU'):
+    def get_breaker(self, endpoint, region_code):
+        key = (endpoint, region_code)
+        with self._breakers_lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(f"{endpoint}/{region_code}", BREAKER_FAILURES, BREAKER_RESET)
+                self.breakers[key] = breaker
+            return breaker
+
+    def breaker_states(self):
+        """{'endpoint/регион': состояние} для мониторинга"""
+        with self._breakers_lock:
+            breakers = list(self.breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+    def is_available(self, region_code, endpoints=('storesearch', 'appdetails')):
+        return all(self.get_breaker(endpoint, region_code).available() for endpoint in endpoints)
+
+    def latency_stats(self):
+        """Перцентили задержек, текущие таймауты и расход бюджета повторов"""
+        stats = {name: tracker.snapshot() for name, tracker in self.latency.items()}
+        stats['hedge'] = self.hedge_budget.snapshot()
+        return stats
+
+    def _send(self, endpoint, params, latency_key):
+        """Один GET с таймаутом по недавнему p99 этого endpoint"""
+        tracker = self.latency[latency_key]
+        timeout = tracker.timeout()
+        start = time.monotonic()
+        try:
+            response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=timeout)
+        except requests.Timeout:
+            tracker.record(timeout)
+            raise
+        tracker.record(time.monotonic() - start)
+        return response
+
+    def _send_hedged(self, endpoint, params, latency_key):
+        """Если ответа нет дольше p95, отправляет второй запрос; побеждает первый ответ"""
+        self.hedge_budget.deposit()
+        p95 = self.latency[latency_key].percentile(95)
+        if p95 is None:
+            return self._send(endpoint, params, latency_key)
+
+        started = threading.Event()
+
+        def primary():
+            started.set()
+            return self._send(endpoint, params, latency_key)
+
+        # p95 отсчитывается от начала запроса: время в очереди пула не повод для повтора
+        attempts = [self._hedge_pool.submit(primary)]
+        started.wait()
+        done, _ = wait(attempts, timeout=p95)
+        if not done and self.hedge_budget.try_spend():
+            attempts.append(self._hedge_pool.submit(self._send, endpoint, params, latency_key))
+
+        # Побеждает первый нормальный ответ: быстрая ошибка не должна опередить удачную попытку.
+        # Проигравшая попытка дорабатывает в фоне, ее ответ просто не нужен
+        failed = None
+        error = None
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if not _is_steam_failure(response):
+                    return response
+                failed = response
+        # Все попытки неудачны: ответ с ошибкой отдаем в _request, чтобы его учел предохранитель
+        if failed is not None:
+            return failed
+        raise error
+
+    def _request(self, endpoint, region_code, params, latency_key=None, hedge=False):
+        """GET к Steam через предохранитель endpoint/регион.
+
+        Сетевые ошибки, 5xx и 429 считаются сбоями Steam; при разомкнутом
+        предохранителе сразу бросает CircuitOpenError.
+        """
+        breaker = self.get_breaker(endpoint, region_code)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Steam {endpoint} unavailable in region {region_code}")
+
+        latency_key = latency_key or endpoint
+        try:
+            if hedge and self.hedge_appdetails:
+                response = self._send_hedged(endpoint, params, latency_key)
+            else:
+                response = self._send(endpoint, params, latency_key)
+        except Exception:
+            breaker.record_failure()
+            raise
+
+        if _is_steam_failure(response):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        response.raise_for_status()
+        return response
+
+    def search_game(self, game_name, region_code='RU', limit=5):
         """Обычный поиск игры в Steam с учетом региона"""
         try:
-            url = f"{self.base_url}/storesearch"
             region_params = self.get_region_params(region_code)
 
             params = {
                 'term': game_name,
                 'l': region_params['l'],
                 'cc': region_params['cc'],
-                'limit': 5
+                'limit': limit
             }
 
             logger.info(f'Поиск игры: {game_name} в регионе {region_code}')
 
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            response = self._request('storesearch', region_code, params)
             data = response.json()
 
             if data.get('items'):
+                self.search_fallback.set((game_name.lower(), region_code, limit), data['items'])
                 return data['items']
             return None
 
         except Exception as e:
             logger.error(f"Steam search error in region {region_code}: {e}")
+            stale = self.search_fallback.get((game_name.lower(), region_code, limit))
+            if stale:
+                # Сохраненная выдача помечается, чтобы бот предупредил пользователя
+                return [dict(game, stale=True) for game in stale]
             return None
 
-    def smart_game_search(self, game_name, region_code='RU'):
+    def smart_game_search(self, game_name, region_code='RU', limit=5):
         """Умный поиск игры с обработкой альтернативных названий и учетом региона"""
         # Сначала пробуем прямой поиск
-        games = self.search_game(game_name, region_code)
+        games = self.search_game(game_name, region_code, limit)
 
         if games:
             return games
@@ -94,7 +301,7 @@ class SteamAPI:
         alternative_names = self.get_alternative_names(game_name)
 
         for alt_name in alternative_names:
-            games = self.search_game(alt_name, region_code)
+            games = self.search_game(alt_name, region_code, limit)
             if games:
                 return games
 
@@ -142,6 +349,9 @@ class SteamAPI:
 
     def get_region_issue_message(self, region_code):
         """Возвращает сообщение о возможных проблемах с регионом"""
+        if not self.is_available(region_code):
+            return "⚠️ Steam сейчас не отвечает, попробуйте через минуту"
+
         region_messages = {
             'RU': "⚠️ В России могут быть ограничения на некоторые игры",
             'TR': "⚠️ В Турции могут быть региональные ограничения",
@@ -153,8 +363,11 @@ class SteamAPI:
 
     def get_game_details(self, game_id, region_code='RU'):
         """Получение детальной информации об игре с учетом региона"""
+        cached = self.details_cache.get((str(game_id), region_code))
+        if cached is not None:
+            return cached
+
         try:
-            url = f"{self.base_url}/appdetails"
             region_params = self.get_region_params(region_code)
 
             params = {
@@ -166,14 +379,18 @@ class SteamAPI:
 
             logger.info(f'Запрос подробностей об {game_id} для региона {region_code}')
 
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            response = self._request('appdetails', region_code, params, hedge=True)
             data = response.json()
 
             if str(game_id) in data and data[str(game_id)].get('success'):
                 game_data = data[str(game_id)]['data']
                 # Добавляем ID игры в данные для удобства
                 game_data['id'] = game_id
+                # Версия данных для кеша карточек: меняется вместе с ответом Steam
+                game_data['details_version'] = zlib.crc32(response.content)
+                self.details_cache.set((str(game_id), region_code), game_data)
+                if self.price_history is not None and game_data.get('price_overview'):
+                    self.price_history.safe_record(game_id, region_code, game_data['price_overview'])
                 return game_data
             else:
                 logger.warning(f"Игра {game_id} не найдена или недоступна в регионе {region_code}")
@@ -181,11 +398,65 @@ class SteamAPI:
 
         except Exception as e:
             logger.error(f"Steam details error for {game_id} in region {region_code}: {e}")
+            stale = self.details_cache.get_stale((str(game_id), region_code))
+            if stale is not None:
+                return dict(stale, stale=True)
             return None
 
-    def format_game_info(self, game_data, region_code='RU'):
-        """Форматирование информации об игре для Telegram с учетом региона"""
+    def get_price_overviews(self, game_ids, region_code='RU'):
+        """Цены сразу нескольких игр одним запросом appdetails (filters=price_overview).
+
+        Возвращает {appid: price_overview или None для бесплатных и недоступных}.
+        При ошибке запроса соответствующие appid в ответ не попадают: устаревшие
+        цены здесь не отдаются, чтобы не рассылать уведомления о прошедших скидках.
+        """
+        prices = {}
+        region_params = self.get_region_params(region_code)
+
+        for start in range(0, len(game_ids), PRICE_BATCH_SIZE):
+            batch = [str(game_id) for game_id in game_ids[start:start + PRICE_BATCH_SIZE]]
+            try:
+                params = {
+                    'appids': ','.join(batch),
+                    'filters': 'price_overview',
+                    'cc': region_params['cc'],
+                    'currency': region_params['currency']
+                }
+
+                logger.info(f'Запрос цен {len(batch)} игр для региона {region_code}')
+
+                response = self._request('appdetails', region_code, params, latency_key='appdetails_prices')
+                data = response.json()
+
+                for game_id in batch:
+                    entry = data.get(game_id) or {}
+                    # Для бесплатных игр Steam отдает пустой список вместо словаря
+                    game_data = entry.get('data') if entry.get('success') else None
+                    price_overview = game_data.get('price_overview') if isinstance(game_data, dict) else None
+                    prices[int(game_id)] = price_overview
+                    if price_overview and self.price_history is not None:
+                        self.price_history.safe_record(game_id, region_code, price_overview)
+
+            except Exception as e:
+                logger.error(f"Steam price batch error in region {region_code}: {e}")
+
+        return prices
+
+    def format_game_info(self, game_data, region_code='RU', limit=CAPTION_LIMIT):
+        """Форматирование информации об игре для Telegram с учетом региона.
+
+        Текст экранирован под CARD_PARSE_MODE и укладывается в limit символов,
+        готовые карточки кешируются по (appid, регион, версия данных, limit).
+        """
         try:
+            version = game_data.get('details_version')
+            stale = bool(game_data.get('stale'))
+            cache_key = (game_data.get('id', game_data.get('steam_appid')), region_code, version, limit, stale)
+            if version is not None:
+                card = self.card_cache.get(cache_key)
+                if card is not None:
+                    return card
+
             # Основная информация
             name = game_data.get('name', 'Неизвестно')
             price_info = game_data.get('price_overview', {})
@@ -194,60 +465,58 @@ class SteamAPI:
 
             # Обработка цены
             if price_info:
-                price = f"💰 {price_info.get('final_formatted', 'Бесплатно')}"
+                price = f"💰 {truncate_markdown(price_info.get('final_formatted', 'Бесплатно'), CARD_FIELD_LIMIT)}"
                 if price_info.get('discount_percent', 0) > 0:
-                    price += f" (скидка {price_info['discount_percent']}% 🔥)"
+                    price += f" \\(скидка {price_info['discount_percent']}% 🔥\\)"
             else:
                 price = "🤑 Бесплатно 🤑"
+            if stale:
+                price += "\n⚠️ _Steam недоступен, данные могут быть устаревшими_"
 
             # Дата выхода
             release_date = game_data.get('release_date', {})
             if release_date.get('coming_soon'):
                 release_info = "🕐 Скоро выйдет"
             else:
-                release_info = f"📅 {release_date.get('date', 'Неизвестно')}"
+                release_info = f"📅 {truncate_markdown(release_date.get('date', 'Неизвестно'), CARD_FIELD_LIMIT)}"
 
-            # Разработчики и издатели
-            developers = ", ".join(game_data.get('developers', [])) or "Неизвестно"
-            publishers = ", ".join(game_data.get('publishers', [])) or "Неизвестно"
+            # Рейтинги
+            metacritic = game_data.get('metacritic', {})
+            metacritic_score = f"⭐️ {truncate_markdown(metacritic.get('score', 'N/A'), CARD_FIELD_LIMIT)}" if metacritic else "Оценка не указана"
 
             # Жанры
             genres = [genre['description'] for genre in game_data.get('genres', [])]
-            genres_str = ", ".join(genres) if genres else "Не указаны"
-
-            # Рейтинги
-            metacritic = game_data.get('metacritic', {})
-            metacritic_score = f"⭐️ {metacritic.get('score', 'N/A')}" if metacritic else "Оценка не указана"
 
             # Описание (обрезаем если слишком длинное)
             description = game_data.get('short_description', 'Описание отсутствует')
             if len(description) > 400:
                 description = description[:400] + "..."
 
-            # Информация о регионе
-            region_info = f"🌍 Регион: {region_code}"
-
-            # Формируем сообщение
-            message = f"""
-🎮 *{name}*
-
-{price}
-{release_info}
-{metacritic_score}
-{region_info}
-
-*Разработчик:* {developers}
-*Издатель:* {publishers}
-*Жанры:* {genres_str}
-
-📖 *Описание:*
-{description}
+            # Каждое поле из ответа Steam ограничено, иначе длинный список разработчиков
+            # выталкивает карточку за лимит подписи
+            fields = {
+                'name': truncate_markdown(name, CARD_FIELD_LIMIT),
+                'price': price,
+                'release_info': release_info,
+                'metacritic_score': metacritic_score,
+                'region': escape_markdown(region_code),
+                'developers': truncate_markdown(", ".join(game_data.get('developers', [])) or "Неизвестно", CARD_FIELD_LIMIT),
+                'publishers': truncate_markdown(", ".join(game_data.get('publishers', [])) or "Неизвестно", CARD_FIELD_LIMIT),
+                'genres': truncate_markdown(", ".join(genres) if genres else "Не указаны", CARD_FIELD_LIMIT),
+                'appid': escape_markdown(game_data.get('steam_appid', '')),
+            }
 
-[Открыть в Steam](https://store.steampowered.com/app/{game_data.get('steam_appid', '')})
-            """
+            # Описанию достается все, что осталось до лимита Telegram
+            without_description = _utf16_len(CARD_TEMPLATE.format(description='', **fields))
+            fields['description'] = truncate_markdown(description, limit - without_description)
 
-            return message.strip()
+            message = CARD_TEMPLATE.format(**fields)
+            if _utf16_len(message) > limit:
+                raise ValueError(f"карточка {_utf16_len(message)} > {limit}")
+            if version is not None:
+                self.card_cache.set(cache_key, message)
+            return message
 
         except Exception as e:
             logger.error(f"Format error: {e}")
-            return f"❌ Ошибка при форматировании информации об игре"
\ No newline at end of file
+            return f"❌ Ошибка при форматировании информации об игре"
@@ -0,0 +1,217 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from logger import logger
+
+
+class Watchlist:
+    """Подписки на скидки, сгруппированные по (appid, регион).
+
+    Проверка идет по уникальным парам, поэтому ее стоимость зависит от
+    числа разных игр, а не от числа подписчиков.
+    """
+
+    def __init__(self, path='watchlist.json'):
+        self.path = path
+        # (appid, region) -> {user_id: подписка}
+        self._pairs = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading watchlist: {e}")
+            return
+
+        with self._lock:
+            for entry in entries:
+                key = (entry['appid'], entry['region'])
+                self._pairs.setdefault(key, {})[entry['user_id']] = entry
+
+    def save(self):
+        with self._lock:
+            entries = [entry for subscribers in self._pairs.values() for entry in subscribers.values()]
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving watchlist: {e}")
+
+    def add(self, user_id, chat_id, appid, region_code, threshold, name):
+        """Подписывает пользователя на скидку не меньше threshold процентов"""
+        entry = {
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'appid': int(appid),
+            'region': region_code,
+            'threshold': threshold,
+            'name': name,
+            # Скидка, о которой уже сообщили, чтобы не повторяться каждый цикл
+            'notified': 0
+        }
+        with self._lock:
+            self._pairs.setdefault((int(appid), region_code), {})[user_id] = entry
+        self.save()
+        return entry
+
+    def remove(self, user_id, appid, region_code):
+        with self._lock:
+            subscribers = self._pairs.get((int(appid), region_code), {})
+            removed = subscribers.pop(user_id, None)
+            if not subscribers:
+                self._pairs.pop((int(appid), region_code), None)
+        if removed:
+            self.save()
+        return removed
+
+    def for_user(self, user_id):
+        with self._lock:
+            entries = [subscribers[user_id] for subscribers in self._pairs.values() if user_id in subscribers]
+        return sorted(entries, key=lambda entry: entry['name'])
+
+    def appids_by_region(self):
+        """{регион: [appid, ...]} - по одной записи на уникальную пару"""
+        with self._lock:
+            regions = {}
+            for appid, region_code in self._pairs:
+                regions.setdefault(region_code, []).append(appid)
+        return regions
+
+    def subscribers(self, appid, region_code):
+        with self._lock:
+            return list(self._pairs.get((appid, region_code), {}).values())
+
+
+class RateLimitedSender:
+    """Очередь уведомлений с лимитами Telegram: общий и на один чат.
+
+    Каждому сообщению при постановке в очередь назначается время отправки,
+    поэтому ждущий чат не задерживает сообщения в другие чаты.
+    """
+
+    def __init__(self, bot, global_rate=25, per_chat_rate=1):
+        self.bot = bot
+        self.global_interval = 1 / global_rate
+        self.chat_interval = 1 / per_chat_rate
+        self._heap = []
+        self._chat_next = {}
+        self._global_next = 0.0
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def send(self, chat_id, text, **kwargs):
+        with self._condition:
+            now = time.monotonic()
+            send_at = max(now, self._chat_next.get(chat_id, 0.0))
+            self._chat_next[chat_id] = send_at + self.chat_interval
+            heapq.heappush(self._heap, (send_at, next(self._counter), chat_id, text, kwargs))
+            self._condition.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='RateLimitedSender', daemon=True)
+            self._thread.start()
+        return self
+
+    def _next_message(self):
+        with self._condition:
+            while True:
+                if self._heap:
+                    ready_at = max(self._heap[0][0], self._global_next)
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0:
+                        self._global_next = time.monotonic() + self.global_interval
+                        return heapq.heappop(self._heap)
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            send_at, _, chat_id, text, kwargs = self._next_message()
+            try:
+                self.bot.send_message(chat_id, text, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    # Telegram сам говорит, сколько ждать
+                    retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                    with self._condition:
+                        self._global_next = time.monotonic() + retry_after
+                        heapq.heappush(self._heap, (send_at, next(self._counter), chat_id, text, kwargs))
+                else:
+                    logger.error(f"Notification error for chat {chat_id}: {e}")
+            except Exception as e:
+                logger.error(f"Notification error for chat {chat_id}: {e}")
+
+
+class DiscountChecker:
+    """Фоновая проверка подписок: один пакетный запрос цен на регион и пачку игр"""
+
+    def __init__(self, steam_api, watchlist, sender, format_message, interval=3600, parse_mode=None):
+        self.steam_api = steam_api
+        self.watchlist = watchlist
+        self.sender = sender
+        # format_message(подписка, price_overview) -> текст уведомления
+        self.format_message = format_message
+        self.interval = interval
+        self.parse_mode = parse_mode
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='DiscountChecker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Discount check error: {e}")
+            self._stop.wait(self.interval)
+
+    def check(self):
+        """Один цикл проверки; возвращает число отправленных уведомлений"""
+        notified = 0
+        changed = False
+
+        for region_code, appids in self.watchlist.appids_by_region().items():
+            prices = self.steam_api.get_price_overviews(appids, region_code)
+
+            for appid, price_overview in prices.items():
+                discount = price_overview.get('discount_percent', 0) if price_overview else 0
+
+                for entry in self.watchlist.subscribers(appid, region_code):
+                    if discount >= entry['threshold'] and discount > 0:
+                        if entry['notified'] != discount:
+                            self.sender.send(entry['chat_id'], self.format_message(entry, price_overview),
+                                             parse_mode=self.parse_mode)
+                            entry['notified'] = discount
+                            notified += 1
+                            changed = True
+                    elif entry['notified']:
+                        # Распродажа закончилась - следующая снова придет уведомлением
+                        entry['notified'] = 0
+                        changed = True
+
+        if changed:
+            self.watchlist.save()
+        logger.info(f"Проверка скидок: отправлено {notified} уведомлений")
+        return notified
@@ -0,0 +1 @@
+"""Бенчмарки бота: локальные заглушки Steam/Telegram и прогон нагрузки"""
@@ -0,0 +1,377 @@
+"""Нагрузочный прогон обработчиков main.py через локальные заглушки Steam и Telegram.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bot_traffic --sessions 300 --concurrency 8 --steam-latency 0.05
+    python -m benchmarks.bot_traffic --save baseline.json
+    python -m benchmarks.bot_traffic --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from telebot import apihelper
+
+from benchmarks.stubs import CATALOG, FakeUpdates, SteamStub, TelegramStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEARCH_QUERIES = [
+    'Ведьмак 3', 'ведьмак', 'Киберпанк 2077', 'ГТА 5', 'кс2', 'Дота 2', 'скайрим',
+    'фоллаут', 'ассасин', 'rdr2', 'The Witcher', 'Cyberpunk', 'Terraria', 'Stardew',
+    'несуществующая игра',
+]
+INLINE_QUERIES = ['witcher', 'ведьмак', 'Counter-Strike', 'fallout', 'гта', 'Grand Theft', 'the']
+CHART_COMMANDS = ['/top_games', '/top_games 25', '/top_games 10 RPG', '/playtime', '/playtime log',
+                  '/playtime Action', '/genres', '/correlation', '/asymmetryc']
+REGIONS = ['RU', 'US', 'EU', 'KZ', 'TR', 'AR', 'BR']
+GENRES = ['RPG', 'Action', 'Strategy', 'Adventure', 'Indie', 'Shooter', 'Simulation']
+
+
+def write_dataset(path, rows, seed=0):
+    """Синтетический DataSet.csv в формате load_data_set (cp1251, ';', запятая в дробях)"""
+    rng = random.Random(seed)
+    games = [name for _, name, _, _ in CATALOG] + [f"Игра {i}" for i in range(max(rows // 50, 10))]
+    nicks = [f"friend_{i}" for i in range(max(rows // 20, 5))]
+    with open(path, 'w', encoding='windows-1251', newline='') as f:
+        f.write('Ник;Игра;Жанр;Время;Достижения\n')
+        for _ in range(rows):
+            playtime = int(rng.lognormvariate(3, 1.2))
+            achievements = f"{rng.uniform(0, 100):.1f}".replace('.', ',')
+            f.write(f"{rng.choice(nicks)};{rng.choice(games)};{rng.choice(GENRES)};{playtime};{achievements}\n")
+
+
+def load_bot(workdir, steam, telegram):
+    """Импортирует main.py в рабочей папке бенчмарка и направляет его на заглушки"""
+    with open(os.path.join(workdir, 'Token.txt'), 'w') as f:
+        f.write('123456:BENCHMARK')
+
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    apihelper.API_URL = telegram.api_url
+    main = importlib.import_module('main')
+    # Обработчики выполняются синхронно в потоке, который прислал апдейт
+    main.bot.threaded = False
+    main.steam_api.base_url = steam.base_url
+    # Инлайн-запросы отвечаются в том же потоке, иначе задержку не измерить
+    main.INLINE_DEBOUNCE = 0
+    return main
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, step, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+
+class ErrorCounter(logging.Handler):
+    """Считает logger.error бота по потокам.
+
+    Обработчики main.py ловят исключения сами и отвечают текстом ошибки, поэтому
+    до Traffic.send они не доходят; сбой шага виден только по записи в лог.
+    Ошибки фоновых потоков (предзагрузка, инлайн, проверка скидок) идут в background.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.local = threading.local()
+        self.background = 0
+
+    def emit(self, record):
+        # logging вызывает emit под блокировкой обработчика
+        if getattr(self.local, 'active', False):
+            self.local.count += 1
+        else:
+            self.background += 1
+
+    def begin(self):
+        self.local.active = True
+        self.local.count = 0
+
+    def end(self):
+        self.local.active = False
+        return self.local.count
+
+
+class Traffic:
+    """Сценарии пользователей: поиск с выбором, инлайн-поиск, история цен, смена региона,
+    статистика друзей и графики"""
+
+    def __init__(self, main, telegram, recorder, think_time=0.0, errors=None):
+        self.think_time = think_time
+        self.errors = errors
+        self.bot = main.bot
+        self.telegram = telegram
+        self.recorder = recorder
+        self.updates = FakeUpdates()
+
+    def send(self, step, update):
+        start = time.perf_counter()
+        ok = True
+        if self.errors is not None:
+            self.errors.begin()
+        try:
+            self.bot.process_new_updates([update])
+        except Exception:
+            ok = False
+        finally:
+            if self.errors is not None and self.errors.end():
+                ok = False
+        self.recorder.add(step, time.perf_counter() - start, ok)
+
+    def search(self, user_id, rng):
+        self.send('search:/search', self.updates.message(user_id, '/search'))
+        self.send('search:name', self.updates.message(user_id, rng.choice(SEARCH_QUERIES)))
+
+        buttons = self.telegram.buttons(user_id)
+        options = [data for data in buttons if not data.startswith('cancel_search')]
+        cancel = [data for data in buttons if data.startswith('cancel_search')]
+        message_id = self.telegram.last_message.get(user_id)
+        if options:
+            # Пользователю нужно время, чтобы прочитать варианты
+            time.sleep(self.think_time)
+            self.send('search:select', self.updates.callback(user_id, rng.choice(options), message_id))
+        elif cancel:
+            self.send('search:cancel', self.updates.callback(user_id, cancel[0], message_id))
+
+    def inline(self, user_id, rng):
+        """Набор запроса по буквам (каждый префикс - отдельный апдейт) и следующая страница"""
+        query = rng.choice(INLINE_QUERIES)
+        for end in range(2, len(query) + 1):
+            update = self.updates.inline_query(user_id, query[:end])
+            self.send('inline:typing' if end < len(query) else 'inline:query', update)
+
+        next_offset = self.telegram.next_offsets.get(update.inline_query.id)
+        if next_offset:
+            self.send('inline:next_page', self.updates.inline_query(user_id, query, next_offset))
+
+    def history(self, user_id, rng):
+        self.send('history', self.updates.message(user_id, f"/history {rng.choice(SEARCH_QUERIES)}"))
+
+    def region(self, user_id, rng):
+        self.send('region:/region', self.updates.message(user_id, '/region'))
+        message_id = self.telegram.last_message[user_id]
+        self.send('region:set', self.updates.callback(user_id, f"set_region:{rng.choice(REGIONS)}", message_id))
+
+    def profile(self, user_id, rng):
+        if rng.random() < 0.5:
+            self.send('profile:/player', self.updates.message(user_id, f"/player friend_{rng.randrange(50)}"))
+        else:
+            self.send('profile:/game', self.updates.message(user_id, f"/game {rng.choice(CATALOG)[1]}"))
+
+    def chart(self, user_id, rng):
+        command = rng.choice(CHART_COMMANDS)
+        self.send(f"chart:{command}", self.updates.message(user_id, command))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run(traffic, sessions, concurrency, users, mix, seed):
+    """Прогоняет сессии: поток w обслуживает своих пользователей, чтобы не смешивать состояния"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    users = max(users, concurrency) // concurrency * concurrency
+
+    def worker(w):
+        rng = random.Random(seed + w)
+        for i in range(w, sessions, concurrency):
+            user_id = 1000 + i % users
+            getattr(traffic, rng.choices(names, weights)[0])(user_id, rng)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed, steam, telegram, memory, steam_api, errors):
+    steps = {}
+    total = 0
+    for step, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        total += len(ordered)
+        steps[step] = {
+            'count': len(ordered),
+            'errors': recorder.errors.get(step, 0),
+            'mean_ms': sum(ordered) / len(ordered) * 1000,
+            'p50_ms': percentile(ordered, 50) * 1000,
+            'p95_ms': percentile(ordered, 95) * 1000,
+            'p99_ms': percentile(ordered, 99) * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+    return {
+        'updates': total,
+        'elapsed_s': elapsed,
+        'throughput_ups': total / elapsed if elapsed else 0.0,
+        'steps': steps,
+        'background_errors': errors.background,
+        'steam_calls': dict(steam.calls),
+        'telegram_calls': dict(telegram.calls),
+        'memory': memory,
+        'breakers': steam_api.breaker_states(),
+        'steam_latency': steam_api.latency_stats(),
+    }
+
+
+def print_report(report):
+    print(f"Апдейтов: {report['updates']} за {report['elapsed_s']:.2f} с "
+          f"({report['throughput_ups']:.1f} апдейтов/с)")
+    print(f"{'шаг':<24}{'n':>6}{'ошибок':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for step, s in report['steps'].items():
+        print(f"{step:<24}{s['count']:>6}{s['errors']:>8}{s['mean_ms']:>10.1f}{s['p50_ms']:>10.1f}"
+              f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    if report.get('background_errors'):
+        print(f"Ошибок в фоновых потоках: {report['background_errors']}")
+    updates = report['updates'] or 1
+    telegram_total = sum(report['telegram_calls'].values())
+    print(f"Steam: {report['steam_calls']}")
+    print(f"Telegram: {report['telegram_calls']} ({telegram_total / updates:.2f} вызова на апдейт)")
+    print('Память: ' + ', '.join(f"{key}={value:.1f} МБ" for key, value in report['memory'].items()))
+    tripped = {name: state for name, state in report.get('breakers', {}).items()
+               if state['state'] != 'closed' or state['rejected']}
+    if tripped:
+        print(f"Предохранители Steam: {tripped}")
+    latency = report.get('steam_latency', {})
+    for name, state in latency.items():
+        if name != 'hedge' and state['samples']:
+            p95 = f"{state['p95'] * 1000:.0f}" if state['p95'] is not None else '-'
+            print(f"Steam {name}: замеров {state['samples']}, p95 {p95} мс, таймаут {state['timeout']:.2f} с")
+    if latency.get('hedge', {}).get('hedged') or latency.get('hedge', {}).get('denied'):
+        print(f"Повторы appdetails: {latency['hedge']}")
+
+
+def compare(report, baseline, tolerance):
+    """Список регрессий p95 относительно сохраненного прогона"""
+    regressions = []
+    for step, s in report['steps'].items():
+        old = baseline['steps'].get(step)
+        if old and s['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {old['p95_ms']:.1f} -> {s['p95_ms']:.1f} мс")
+    if report['throughput_ups'] < baseline['throughput_ups'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput_ups']:.1f} -> {report['throughput_ups']:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--mix', type=parse_mix, default='search=5,inline=2,history=1,region=1,profile=2,chart=3',
+                        help='веса сценариев, например search=5,inline=2,history=1,region=1,profile=2,chart=3')
+    parser.add_argument('--think-time', type=float, default=0.3,
+                        help='пауза пользователя перед выбором игры из списка, с')
+    parser.add_argument('--rows', type=int, default=2000, help='строк в синтетическом DataSet.csv')
+    parser.add_argument('--steam-latency', type=float, default=0.05, help='средняя задержка Steam, с')
+    parser.add_argument('--steam-error-rate', type=float, default=0.0)
+    parser.add_argument('--steam-tail-rate', type=float, default=0.0, help='доля медленных ответов Steam')
+    parser.add_argument('--steam-tail-latency', type=float, default=1.0, help='задержка медленного ответа, с')
+    parser.add_argument('--no-hedge', action='store_true', help='без повторных запросов appdetails')
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--tracemalloc', action='store_true', help='пиковая память Python (замедляет прогон)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', help='сохранить отчет в JSON')
+    parser.add_argument('--compare', help='сравнить с сохраненным отчетом')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+    # load_bot меняет рабочую папку, поэтому пути к отчетам фиксируем заранее
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    steam = SteamStub(latency=args.steam_latency, error_rate=args.steam_error_rate, seed=args.seed,
+                      tail_rate=args.steam_tail_rate, tail_latency=args.steam_tail_latency).start()
+    telegram = TelegramStub(latency=args.telegram_latency, seed=args.seed).start()
+    workdir = tempfile.mkdtemp(prefix='gamebot-bench-')
+    write_dataset(os.path.join(workdir, 'DataSet.csv'), args.rows, args.seed)
+
+    try:
+        bot_module = load_bot(workdir, steam, telegram)
+        if args.no_hedge:
+            bot_module.steam_api.hedge_appdetails = False
+
+        warmup = Traffic(bot_module, telegram, Recorder())
+        run(warmup, args.warmup, args.concurrency, args.users, args.mix, args.seed)
+        steam.calls.clear()
+        telegram.calls.clear()
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        recorder = Recorder()
+        errors = ErrorCounter()
+        bot_logger = logging.getLogger('GameBot')
+        bot_logger.addHandler(errors)
+        try:
+            elapsed = run(Traffic(bot_module, telegram, recorder, args.think_time, errors), args.sessions,
+                          args.concurrency, args.users, args.mix, args.seed + 1)
+        finally:
+            bot_logger.removeHandler(errors)
+
+        memory = {}
+        if args.tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory.update(traced_current=current / 2 ** 20, traced_peak=peak / 2 ** 20)
+        if resource is not None:
+            # ru_maxrss в килобайтах на Linux и в байтах на macOS
+            scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+            memory['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    finally:
+        steam.stop()
+        telegram.stop()
+
+    report = summarize(recorder, elapsed, steam, telegram, memory, bot_module.steam_api, errors)
+    print_report(report)
+
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if compare_path:
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Сравнение отрисовки графиков: seaborn против облегченного Agg-рендера.
+
+Меряется холодная отрисовка (кеш картинок сбрасывается перед каждым
+прогоном, агрегаты остаются прогретыми) и размер результата.
+
+Запуск из корня репозитория:
+    python -m benchmarks.charts
+    python -m benchmarks.charts --rows 100000 --repeat 5
+"""
+import argparse
+import sys
+import time
+
+from DataSetAnalys import clear_chart_cache, create_playtime_distribution, create_top_games_plot
+from benchmarks.stats import make_frame
+
+VARIANTS = [
+    ('seaborn', 'png'),
+    ('fast', 'png'),
+    ('fast', 'webp'),
+    ('fast', 'svg'),
+]
+
+CHARTS = {
+    'top_games': lambda df, **kwargs: create_top_games_plot(df, 15, **kwargs),
+    'playtime': lambda df, **kwargs: create_playtime_distribution(df, 30, **kwargs),
+    'playtime log': lambda df, **kwargs: create_playtime_distribution(df, 30, log_scale=True, **kwargs),
+}
+
+
+def measure(chart, df, renderer, image_format, repeat):
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        clear_chart_cache()
+        start = time.perf_counter()
+        size = len(chart(df, renderer=renderer, image_format=image_format).getvalue())
+        best = min(best, time.perf_counter() - start)
+    return best, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = make_frame(args.rows)
+    print(f"{'график':<14}{'рендер':<10}{'формат':<8}{'мс':>10}{'КБ':>10}")
+    for name, chart in CHARTS.items():
+        # Прогрев агрегатов и шрифтов, чтобы мерить только отрисовку
+        chart(df)
+        for renderer, image_format in VARIANTS:
+            seconds, size = measure(chart, df, renderer, image_format, args.repeat)
+            print(f"{name:<14}{renderer:<10}{image_format:<8}{seconds * 1000:>10.1f}{size / 1024:>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
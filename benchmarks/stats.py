@@ -0,0 +1,87 @@
+"""Сравнение compute_dataset_stats с исходными pandas-функциями DataSetAnalys.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stats
+    python -m benchmarks.stats --sizes 1e3,1e4,1e5,1e6,1e7 --repeat 3
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from DataSetAnalys import (compute_dataset_stats,
+                           get_basic_stats,
+                           test_playtime_achievements_correlation,
+                           test_playtime_is_assymetryc)
+
+GENRES = np.array(['RPG', 'Action', 'Strategy', 'Adventure', 'Indie', 'Shooter', 'Simulation'], dtype=object)
+
+
+def make_frame(rows, seed=0):
+    """Синтетический датасет с теми же колонками, что у load_data_set"""
+    rng = np.random.default_rng(seed)
+    nicks = np.array([f"friend_{i}" for i in range(max(rows // 20, 5))], dtype=object)
+    games = np.array([f"Игра {i}" for i in range(max(rows // 50, 10))], dtype=object)
+    return pd.DataFrame({
+        'Nick': nicks[rng.integers(0, len(nicks), rows)],
+        'Game': games[rng.integers(0, len(games), rows)],
+        'Genre': GENRES[rng.integers(0, len(GENRES), rows)],
+        'Playtime': rng.lognormal(3, 1.2, rows).astype(np.int64),
+        'Achievements': rng.uniform(0, 100, rows).round(1),
+    })
+
+
+def pandas_path(df):
+    stats = get_basic_stats(df)
+    correlation, _, _, group_stats = test_playtime_achievements_correlation(df)
+    stats.update(correlation=correlation, skew=test_playtime_is_assymetryc(df), group_stats=group_stats)
+    return stats
+
+
+def best_time(func, df, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def results_match(expected, actual):
+    for key, value in expected.items():
+        if key == 'group_stats':
+            try:
+                pd.testing.assert_frame_equal(actual[key], value, check_exact=False, rtol=1e-9)
+            except AssertionError:
+                return False
+        elif not np.isclose(actual[key], value, rtol=1e-9, equal_nan=True):
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1e3,1e4,1e5,1e6',
+                        help='размеры датасетов через запятую')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'строк':>10}{'pandas, мс':>14}{'numpy, мс':>14}{'ускорение':>12}  совпадает")
+    mismatched = False
+    for size in args.sizes.split(','):
+        rows = int(float(size))
+        df = make_frame(rows)
+        pandas_time, expected = best_time(pandas_path, df, args.repeat)
+        numpy_time, actual = best_time(compute_dataset_stats, df, args.repeat)
+        match = results_match(expected, actual)
+        mismatched |= not match
+        print(f"{rows:>10}{pandas_time * 1000:>14.2f}{numpy_time * 1000:>14.2f}"
+              f"{pandas_time / numpy_time:>11.1f}x  {'да' if match else 'НЕТ'}")
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
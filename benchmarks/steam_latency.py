@@ -0,0 +1,56 @@
+"""Хвостовые задержки appdetails с повторными (hedged) запросами и без них.
+
+Заглушка Steam отвечает с задержкой --latency, а доля --tail-rate ответов
+задерживается на --tail-latency. Кеш подробностей сбрасывается перед
+каждым запросом, чтобы каждый вызов доходил до Steam.
+
+Запуск из корня репозитория:
+    python -m benchmarks.steam_latency
+    python -m benchmarks.steam_latency --requests 1000 --tail-rate 0.02
+"""
+import argparse
+import sys
+import time
+
+from SteamAPI import SteamAPI
+from benchmarks.bot_traffic import percentile
+from benchmarks.stubs import CATALOG, SteamStub
+
+
+def measure(steam, hedge, requests_count):
+    api = SteamAPI(hedge_appdetails=hedge)
+    api.base_url = steam.base_url
+    before = steam.calls.get('appdetails', 0)
+    samples = []
+    for i in range(requests_count):
+        api.details_cache.clear()
+        start = time.perf_counter()
+        api.get_game_details(CATALOG[i % len(CATALOG)][0])
+        samples.append(time.perf_counter() - start)
+    return sorted(samples), steam.calls.get('appdetails', 0) - before, api.latency_stats()['hedge']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--tail-rate', type=float, default=0.03)
+    parser.add_argument('--tail-latency', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    steam = SteamStub(latency=args.latency, seed=args.seed,
+                      tail_rate=args.tail_rate, tail_latency=args.tail_latency).start()
+    try:
+        print(f"{'режим':<10}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'запросов':>10}  бюджет")
+        for hedge in (False, True):
+            samples, calls, budget = measure(steam, hedge, args.requests)
+            row = ''.join(f"{percentile(samples, q) * 1000:>8.0f}" for q in (50, 95, 99, 100))
+            print(f"{'hedge' if hedge else 'обычный':<10}{row}{calls:>10}  {budget if hedge else ''}")
+    finally:
+        steam.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from telebot import types
+
+
+# Каталог заглушки Steam: названия подобраны под псевдонимы из SteamAPI.game_aliases
+CATALOG = [
+    (292030, 'The Witcher 3: Wild Hunt', 1199, ['RPG']),
+    (20920, 'The Witcher 2: Assassins of Kings Enhanced Edition', 499, ['RPG']),
+    (20900, 'The Witcher: Enhanced Edition', 399, ['RPG']),
+    (1091500, 'Cyberpunk 2077', 2999, ['RPG', 'Action']),
+    (271590, 'Grand Theft Auto V', 1499, ['Action']),
+    (12210, 'Grand Theft Auto IV: The Complete Edition', 999, ['Action']),
+    (730, 'Counter-Strike 2', 0, ['Action', 'Free to Play']),
+    (10, 'Counter-Strike', 499, ['Action']),
+    (570, 'Dota 2', 0, ['Strategy', 'Free to Play']),
+    (489830, 'The Elder Scrolls V: Skyrim Special Edition', 1999, ['RPG']),
+    (377160, 'Fallout 4', 1999, ['RPG']),
+    (22380, 'Fallout: New Vegas', 999, ['RPG']),
+    (812140, "Assassin's Creed Odyssey", 2999, ['Action', 'Adventure']),
+    (208650, 'Batman: Arkham Knight', 1999, ['Action']),
+    (418370, 'Resident Evil 7 Biohazard', 1999, ['Action']),
+    (346110, 'ARK: Survival Evolved', 999, ['Adventure']),
+    (440, 'Team Fortress 2', 0, ['Action', 'Free to Play']),
+    (578080, 'PLAYERUNKNOWN\'S BATTLEGROUNDS', 0, ['Action', 'Free to Play']),
+    (1174180, 'Red Dead Redemption 2', 2999, ['Action', 'Adventure']),
+    (105600, 'Terraria', 499, ['Adventure', 'Indie']),
+    (413150, 'Stardew Valley', 599, ['RPG', 'Indie']),
+]
+
+# Множители цен и валюты по коду страны, как в SteamAPI.region_settings
+REGION_PRICES = {
+    'ru': (1.0, 'RUB'), 'us': (0.02, 'USD'), 'de': (0.02, 'EUR'), 'kz': (5.0, 'KZT'),
+    'tr': (0.4, 'TRY'), 'ar': (9.0, 'ARS'), 'br': (0.1, 'BRL'),
+}
+
+
+def _price(base, cc):
+    multiplier, currency = REGION_PRICES.get(cc, REGION_PRICES['ru'])
+    return int(base * 100 * multiplier), currency
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drain_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+
+class _StubServer:
+    """Базовый HTTP-сервер заглушки в отдельном потоке"""
+
+    handler_class = _QuietHandler
+
+    def __init__(self, latency=0.0, jitter=0.5, error_rate=0.0, seed=None, tail_rate=0.0, tail_latency=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Доля медленных ответов с задержкой tail_latency - хвост распределения
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def simulate_network(self):
+        """Задержка и случайная ошибка; True, если запрос должен упасть"""
+        with self.lock:
+            delay = self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+            if self.random.random() < self.tail_rate:
+                delay = self.tail_latency
+            failed = self.random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def start(self):
+        stub = self
+
+        class Handler(self.handler_class):
+            pass
+
+        Handler.stub = stub
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _SteamHandler(_QuietHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit('/', 1)[-1]
+        self.stub.count(endpoint)
+
+        if self.stub.simulate_network():
+            self.stub.count('errors')
+            self._send_json(500, {'error': 'stub failure'})
+            return
+
+        if endpoint == 'storesearch':
+            self._send_json(200, self.stub.storesearch(query))
+        elif endpoint == 'appdetails':
+            self._send_json(200, self.stub.appdetails(query))
+        else:
+            self._send_json(404, {})
+
+
+class SteamStub(_StubServer):
+    """Заглушка store.steampowered.com: storesearch и appdetails"""
+
+    handler_class = _SteamHandler
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.games = {appid: (name, price, genres) for appid, name, price, genres in CATALOG}
+
+    @property
+    def base_url(self):
+        return f"{self.address}/api"
+
+    def storesearch(self, query):
+        words = query.get('term', '').lower().split()
+        limit = int(query.get('limit', 10))
+        cc = query.get('cc', 'ru')
+        items = []
+        for appid, (name, base, _) in self.games.items():
+            if words and all(word in name.lower() for word in words):
+                final, currency = _price(base, cc)
+                items.append({
+                    'type': 'app',
+                    'name': name,
+                    'id': appid,
+                    'price': {'currency': currency, 'initial': final, 'final': final},
+                    'tiny_image': f"https://cdn.example/steam/apps/{appid}/capsule_231x87.jpg",
+                    'metascore': '',
+                })
+        return {'total': len(items), 'items': items[:limit]}
+
+    def appdetails(self, query):
+        cc = query.get('cc', 'ru')
+        only_price = query.get('filters') == 'price_overview'
+        result = {}
+        for appid in query.get('appids', '').split(','):
+            game = self.games.get(int(appid)) if appid.isdigit() else None
+            if game is None:
+                result[appid] = {'success': False}
+                continue
+            name, base, genres = game
+            data = {}
+            if base:
+                final, currency = _price(base, cc)
+                discount = (int(appid) * 7) % 4 * 25 % 100
+                data['price_overview'] = {
+                    'currency': currency,
+                    'initial': final,
+                    'final': final * (100 - discount) // 100,
+                    'discount_percent': discount,
+                    'final_formatted': f"{final * (100 - discount) / 10000:.2f} {currency}",
+                }
+            if not only_price:
+                data.update({
+                    'steam_appid': int(appid),
+                    'name': name,
+                    'is_free': not base,
+                    'short_description': f"{name} — " + "описание игры для бенчмарка. " * 12,
+                    'header_image': f"https://cdn.example/steam/apps/{appid}/header.jpg",
+                    'developers': ['Bench Studio'],
+                    'publishers': ['Bench Publishing'],
+                    'genres': [{'id': str(i), 'description': g} for i, g in enumerate(genres)],
+                    'release_date': {'coming_soon': False, 'date': '1 янв. 2020 г.'},
+                    'metacritic': {'score': 80 + int(appid) % 15},
+                })
+            result[appid] = {'success': True, 'data': data}
+        return result
+
+
+class _TelegramHandler(_QuietHandler):
+    def _handle(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self._drain_body()
+        method = url.path.rsplit('/', 1)[-1]
+        self.stub.count(method)
+        self.stub.simulate_network()
+        self._send_json(200, {'ok': True, 'result': self.stub.reply(method, query)})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class TelegramStub(_StubServer):
+    """Заглушка Bot API: отвечает на вызовы и запоминает клавиатуры по чатам"""
+
+    handler_class = _TelegramHandler
+
+    MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageCaption'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.message_id = 0
+        self.last_markup = {}
+        self.last_message = {}
+        self.next_offsets = {}
+
+    @property
+    def api_url(self):
+        return self.address + "/bot{0}/{1}"
+
+    def reply(self, method, query):
+        if method == 'answerInlineQuery':
+            with self.lock:
+                self.next_offsets[query.get('inline_query_id')] = query.get('next_offset', '')
+        if method not in self.MESSAGE_METHODS:
+            return True
+
+        chat_id = int(query.get('chat_id', 0))
+        with self.lock:
+            if 'message_id' in query:
+                message_id = int(query['message_id'])
+            else:
+                self.message_id += 1
+                message_id = self.message_id
+            self.last_message[chat_id] = message_id
+            if 'reply_markup' in query:
+                self.last_markup[chat_id] = json.loads(query['reply_markup'])
+            else:
+                self.last_markup.pop(chat_id, None)
+
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': query.get('text', ''),
+        }
+
+    def buttons(self, chat_id):
+        """callback_data всех кнопок последней клавиатуры в чате"""
+        with self.lock:
+            markup = self.last_markup.get(chat_id) or {}
+        return [button['callback_data']
+                for row in markup.get('inline_keyboard', [])
+                for button in row if 'callback_data' in button]
+
+
+class FakeUpdates:
+    """Источник апдейтов Telegram для прогона через обработчики бота"""
+
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 10 ** 6
+        self.lock = threading.Lock()
+
+    def _next_ids(self):
+        with self.lock:
+            self.update_id += 1
+            self.message_id += 1
+            return self.update_id, self.message_id
+
+    @staticmethod
+    def user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f"bench{user_id}"}
+
+    def message(self, user_id, text):
+        update_id, message_id = self._next_ids()
+        return types.Update.de_json({
+            'update_id': update_id,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': self.user(user_id),
+                'text': text,
+            },
+        })
+
+    def callback(self, user_id, data, message_id):
+        update_id, _ = self._next_ids()
+        return types.Update.de_json({
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self.user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': '',
+                },
+            },
+        })
+
+    def inline_query(self, user_id, query, offset=''):
+        update_id, _ = self._next_ids()
+        return types.Update.de_json({
+            'update_id': update_id,
+            'inline_query': {
+                'id': str(update_id),
+                'from': self.user(user_id),
+                'query': query,
+                'offset': offset,
+            },
+        })
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кеш с необязательным временем жизни записей.
+
+    С keep_stale=True просроченные записи не удаляются при чтении, а доживают
+    до вытеснения по LRU, чтобы их можно было отдать через get_stale.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, keep_stale=False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.keep_stale = keep_stale
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, stored_at = item
+            if self._expired(stored_at):
+                if not self.keep_stale:
+                    del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key, default=None):
+        """Значение независимо от срока жизни"""
+        with self._lock:
+            item = self._data.get(key)
+            return default if item is None else item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def discard(self, predicate):
+        """Удаляет записи, ключи которых подходят под predicate"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
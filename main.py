@@ -4,29 +4,52 @@ from telebot.handler_backends import State, StatesGroup
 from telebot.custom_filters import StateFilter
 import json
 import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from DataSetAnalys import (create_genre_analysis,
-                           load_data_set,
                            create_top_games_plot,
-                           get_basic_stats,
+                           get_dataset_stats,
                            create_playtime_distribution,
-                           test_playtime_achievements_correlation,
-                           test_playtime_is_assymetryc)
+                           describe_correlation,
+                           get_indexes,
+                           get_aggregates,
+                           normalize_genre,
+                           get_player_stats,
+                           get_game_players)
+from cache import TTLCache
+from DatasetRegistry import DatasetRegistry
 from logger import logger
-from SteamAPI import SteamAPI
+from PriceHistory import PriceHistory
+from Watchlist import Watchlist, RateLimitedSender, DiscountChecker
+from SteamAPI import SteamAPI, CARD_PARSE_MODE, CAPTION_LIMIT, MESSAGE_LIMIT, escape_markdown
 
 # Token.txt - файл с одним токеном, добавлен в gitignore
 with open('Token.txt', 'r') as f:
     TOKEN = f.read()
 
 bot = telebot.TeleBot(TOKEN)
-steam_api = SteamAPI()
+# История цен копится из обычных ответов appdetails
+price_history = PriceHistory('price_history')
+steam_api = SteamAPI(price_history=price_history, hedge_appdetails=True)
 
 # Файл для хранения данных пользователей
 USERS_FILE = 'users.json'
 
-df = load_data_set()
-stats = get_basic_stats(df)
+# Датасеты групп друзей: datasets/*.csv, исходный DataSet.csv - под именем default
+DATASETS_DIR = 'datasets'
+DEFAULT_DATASET = 'default'
+CHAT_DATASETS_FILE = 'chat_datasets.json'
+datasets = DatasetRegistry(DATASETS_DIR)
+if os.path.exists('DataSet.csv'):
+    datasets.add(DEFAULT_DATASET, 'DataSet.csv')
+if DEFAULT_DATASET in datasets:
+    # Статистику и индексы для /player и /game основного датасета готовим сразу, чтобы первый запрос не ждал
+    get_dataset_stats(datasets.get(DEFAULT_DATASET))
+    get_indexes(datasets.get(DEFAULT_DATASET))
 
 # Загрузка пользователей из JSON
 def load_users():
@@ -53,6 +76,39 @@ def save_users():
 user_regions = load_users()
 
 
+def load_chat_datasets():
+    if os.path.exists(CHAT_DATASETS_FILE):
+        try:
+            with open(CHAT_DATASETS_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading chat datasets: {e}")
+    return {}
+
+
+def save_chat_datasets():
+    try:
+        with open(CHAT_DATASETS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(chat_datasets, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Error saving chat datasets: {e}")
+
+
+# Выбранный датасет каждого чата: chat_id -> имя в реестре
+chat_datasets = load_chat_datasets()
+
+
+def get_chat_dataset(chat_id):
+    """Хэндл датасета чата; ValueError, если датасетов нет"""
+    name = chat_datasets.get(str(chat_id), DEFAULT_DATASET)
+    if name not in datasets:
+        names = datasets.names()
+        if not names:
+            raise ValueError("Нет ни одного датасета")
+        name = DEFAULT_DATASET if DEFAULT_DATASET in names else names[0]
+    return datasets.get(name)
+
+
 def get_user_region(user_id, username):
     """Получает регион пользователя (по умолчанию Россия)"""
     if str(user_id) not in user_regions:
@@ -177,6 +233,15 @@ def send_help(message):
 
 /start - начало работы с ботом
 /search - найти игру по названию 🔍
+/history название - история цен и скидок игры 📈
+/watch название [скидка%] - сообщить о скидке 🔔
+/watchlist - ваши подписки на скидки
+/player ник - во что играет друг 👤
+/game название - кто из друзей играет в игру 🎮
+/top_games [N] [жанр] - самые популярные игры друзей 📊
+/playtime [жанр] [log] - распределение времени игры ⏱
+/dataset [имя] - выбрать датасет друзей для этого чата 🗂
+@бот название - быстрый поиск прямо из любого чата ⚡️
 /region - сменить регион (текущий: {current_region}) 🌍
 /help - получить список доступных команд
 
@@ -290,11 +355,36 @@ def handle_game_name_advanced(message):
         send_search_prompt(message.chat.id, "❌ Ошибка поиска. Попробуйте еще раз:")
 
 
+# Сессии выбора игры: результаты поиска хранятся на сервере за коротким токеном
+SEARCH_SESSION_TTL = 600
+search_sessions = TTLCache(maxsize=10000, ttl=SEARCH_SESSION_TTL)
+
+# Предзагрузка подробностей для первых вариантов выбора
+PREFETCH_TOP = 3
+PREFETCH_WORKERS = 4
+PREFETCH_QUEUE = 32
+prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+prefetch_slots = threading.BoundedSemaphore(PREFETCH_QUEUE)
+
+
+def create_search_session(games, user_region):
+    """Сохраняет результаты поиска и возвращает токен для callback_data"""
+    token = secrets.token_urlsafe(6)
+    search_sessions.set(token, {
+        'games': games,
+        'region': user_region,
+        'prefetch': {}
+    })
+    return token
+
+
 def show_game_options(chat_id, games, search_msg_id, user_region):
     """Показывает варианты найденных игр для выбора"""
     markup = types.InlineKeyboardMarkup()
+    games = games[:5]  # Ограничиваем 5 вариантами
+    token = create_search_session(games, user_region)
 
-    for i, game in enumerate(games[:5]):  # Ограничиваем 5 вариантами
+    for i, game in enumerate(games):
         game_name = game['name']
         # Обрезаем длинные названия
         if len(game_name) > 35:
@@ -304,13 +394,15 @@ def show_game_options(chat_id, games, search_msg_id, user_region):
 
         markup.add(types.InlineKeyboardButton(
             f"🎮 {display_name}",
-            callback_data=f"select_game:{game['id']}:{user_region}"
+            callback_data=f"sg:{token}:{i}"
         ))
 
-    markup.add(types.InlineKeyboardButton("❌ Отменить", callback_data="cancel_search"))
+    markup.add(types.InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_search:{token}"))
 
+    stale_notice = "⚠️ Steam не отвечает, показаны сохраненные результаты\n" if games[0].get('stale') else ""
     bot.edit_message_text(
         f"🎯 *Найдено несколько игр в регионе {user_region}:*\n"
+        f"{stale_notice}"
         "(Если игры нет в списке попробуйте написать название на английском)\n"
         "Выберите нужную игру:",
         chat_id=chat_id,
@@ -319,41 +411,100 @@ def show_game_options(chat_id, games, search_msg_id, user_region):
         parse_mode='Markdown'
     )
 
+    # Пока пользователь выбирает, заранее загружаем подробности первых вариантов
+    start_prefetch(token, games[:PREFETCH_TOP], user_region)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('select_game:'))
+
+def _prefetch_details(session, game_id, user_region):
+    # Ответ остается только в steam_api.details_cache: сессия и future его не держат,
+    # иначе 10 000 живых сессий обходят ограничение размера кеша
+    if not session.get('cancelled'):
+        steam_api.get_game_details(game_id, user_region)
+
+
+def start_prefetch(token, games, user_region):
+    """Запускает фоновую загрузку appdetails; при заполненной очереди лишнее пропускается"""
+    session = search_sessions.get(token)
+    if session is None:
+        return
+
+    for game in games:
+        if not prefetch_slots.acquire(blocking=False):
+            break
+        try:
+            future = prefetch_pool.submit(_prefetch_details, session, game['id'], user_region)
+        except RuntimeError:
+            prefetch_slots.release()
+            break
+        # Слот возвращается и для отмененных задач, которые так и не запустились
+        future.add_done_callback(lambda _: prefetch_slots.release())
+        session['prefetch'][game['id']] = future
+
+
+def cancel_prefetch(token):
+    """Отменяет загрузки, которые еще не начались, и закрывает сессию"""
+    session = search_sessions.pop(token)
+    if session is None:
+        return
+
+    session['cancelled'] = True
+    for future in session['prefetch'].values():
+        future.cancel()
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith(('sg:', 'select_game:')))
 def handle_game_selection(call):
     """Обработчик выбора игры из списка"""
     try:
         parts = call.data.split(':')
-        game_id = int(parts[1])
-        user_region = parts[2] if len(parts) > 2 else "RU"
+        session = None
+
+        if parts[0] == 'sg':
+            session = search_sessions.get(parts[1])
+            if session is None:
+                bot.answer_callback_query(call.id, "⌛ Результаты поиска устарели, повторите /search")
+                return
+            game_id = session['games'][int(parts[2])]['id']
+            user_region = session['region']
+        else:
+            # Клавиатуры, отправленные до появления сессий
+            game_id = int(parts[1])
+            user_region = parts[2] if len(parts) > 2 else "RU"
 
         bot.delete_state(call.from_user.id, call.message.chat.id)
 
-        # Показываем загрузку
-        bot.edit_message_text(
-            "🔄 Загружаем информацию...",
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id
-        )
-
-        # Получаем детали игры с учетом региона
-        game_details = steam_api.get_game_details(game_id, user_region)
+        # Уже загруженные данные показываем сразу, без промежуточного сообщения
+        game_details = steam_api.details_cache.get((str(game_id), user_region))
+
+        # Повторная правка тем же текстом Telegram отклоняет (message is not modified)
+        loading_shown = False
+        prefetch = session['prefetch'].get(game_id) if session else None
+        if game_details is None and prefetch is not None and not prefetch.cancelled():
+            # Загрузка уже идет: ждем ее, а не отправляем второй запрос
+            if not prefetch.done():
+                bot.edit_message_text(
+                    "🔄 Загружаем информацию...",
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id
+                )
+                loading_shown = True
+            prefetch.result()
+            game_details = steam_api.details_cache.get((str(game_id), user_region))
+
+        if game_details is None:
+            # Показываем загрузку
+            if not loading_shown:
+                bot.edit_message_text(
+                    "🔄 Загружаем информацию...",
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id
+                )
+
+            # Получаем детали игры с учетом региона
+            game_details = steam_api.get_game_details(game_id, user_region)
 
         if game_details:
-            game_info = steam_api.format_game_info(game_details, user_region)
-            header_image = game_details.get('header_image')
-
-            if header_image:
-                try:
-                    bot.send_photo(call.message.chat.id, header_image, caption=game_info, parse_mode='Markdown')
-                    bot.delete_message(call.message.chat.id, call.message.message_id)
-                except:
-                    bot.edit_message_text(game_info, chat_id=call.message.chat.id,
-                                          message_id=call.message.message_id, parse_mode='Markdown')
-            else:
-                bot.edit_message_text(game_info, chat_id=call.message.chat.id,
-                                      message_id=call.message.message_id, parse_mode='Markdown')
+            send_game_card(call.message.chat.id, call.message.message_id, game_details, user_region)
         else:
             region_issue_msg = steam_api.get_region_issue_message(user_region)
             error_text = f"❌ Ошибка загрузки информации об игре\n\n{region_issue_msg}"
@@ -391,19 +542,26 @@ def process_found_game(game_data, chat_id, search_msg_id, user_region):
         return
 
     # Успешный поиск - показываем результат
-    game_info = steam_api.format_game_info(game_details, user_region)
+    send_game_card(chat_id, search_msg_id, game_details, user_region)
+
+
+def send_game_card(chat_id, message_id, game_details, user_region):
+    """Показывает карточку игры: фото с подписью или текст вместо служебного сообщения"""
     header_image = game_details.get('header_image')
 
     if header_image:
+        # Подпись уже экранирована и укладывается в лимит, поэтому фото уходит с первой попытки
+        caption = steam_api.format_game_info(game_details, user_region, limit=CAPTION_LIMIT)
         try:
-            bot.send_photo(chat_id, header_image, caption=game_info, parse_mode='Markdown')
-            bot.delete_message(chat_id, search_msg_id)
-        except:
-            bot.edit_message_text(game_info, chat_id=chat_id,
-                                  message_id=search_msg_id, parse_mode='Markdown')
-    else:
-        bot.edit_message_text(game_info, chat_id=chat_id,
-                              message_id=search_msg_id, parse_mode='Markdown')
+            bot.send_photo(chat_id, header_image, caption=caption, parse_mode=CARD_PARSE_MODE)
+            bot.delete_message(chat_id, message_id)
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось отправить фото {game_details.get('id')}: {e}")
+
+    game_info = steam_api.format_game_info(game_details, user_region, limit=MESSAGE_LIMIT)
+    bot.edit_message_text(game_info, chat_id=chat_id,
+                          message_id=message_id, parse_mode=CARD_PARSE_MODE)
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('set_region:'))
@@ -448,10 +606,13 @@ def handle_set_region(call):
     logger.info(f"Пользователь {user.username} установил регион {region_code}")
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_search")
+@bot.callback_query_handler(func=lambda call: call.data.split(':')[0] == "cancel_search")
 def handle_cancel_search(call):
     """Обработчик нажатия на кнопку отмены"""
     try:
+        if ':' in call.data:
+            cancel_prefetch(call.data.split(':', 1)[1])
+
         bot.delete_state(call.from_user.id, call.message.chat.id)
         bot.edit_message_text(
             "❌ Поиск отменен",
@@ -463,26 +624,341 @@ def handle_cancel_search(call):
         logger.error(f"Cancel error: {e}")
         bot.answer_callback_query(call.id, "Ошибка отмены")
 
+def format_price(amount, region_code):
+    """Цена из минимальных единиц Steam в валюте региона"""
+    currency = steam_api.get_region_params(region_code)['currency']
+    return f"{amount / 100:.2f} {currency}"
+
+
+@bot.message_handler(commands=['history'])
+def send_price_history(message):
+    """История цен игры по тем ответам Steam, которые бот уже получал"""
+    try:
+        user = message.from_user
+        user_region = get_user_region(user.id, user.username)
+        game_name = message.text.partition(' ')[2].strip()
+
+        if len(game_name) < 2:
+            bot.reply_to(message, "Использование: /history название игры")
+            return
+
+        games = steam_api.smart_game_search(game_name, user_region)
+        if not games:
+            bot.reply_to(message, f"❌ {game_name} не найдена в регионе {user_region}")
+            return
+
+        game = games[0]
+        summary = price_history.summary(game['id'])
+        if user_region not in summary:
+            # Наблюдений в регионе пользователя еще нет: запрос appdetails сам пополнит историю
+            steam_api.get_game_details(game['id'], user_region)
+            summary = price_history.summary(game['id'])
+
+        logger.info(f"Пользователь {user.username} запросил историю цен {game['id']}")
+
+        if not summary:
+            bot.reply_to(message, f"🤑 {game['name']}: цена не найдена, игра бесплатная или недоступна")
+            return
+
+        lines = [f"📈 *{escape_markdown(game['name'])}*", ""]
+        # Регион пользователя первым
+        for region, info in sorted(summary.items(), key=lambda item: item[0] != user_region):
+            current = f"Сейчас: {format_price(info['current_final'], region)}"
+            if info['current_discount']:
+                current += f" (скидка {info['current_discount']}%)"
+            lowest_date = time.strftime('%d.%m.%Y', time.localtime(info['lowest_at']))
+
+            lines.append(f"🌍 *{region}*" + (" \\(ваш регион\\)" if region == user_region else ""))
+            lines.append(escape_markdown(current))
+            lines.append(escape_markdown(f"Минимум: {format_price(info['lowest_final'], region)} ({lowest_date})"))
+            lines.append(escape_markdown(f"Скидки: {info['days_discounted']} из {info['days_observed']} дн. "
+                                         f"наблюдений, максимум {info['max_discount']}%"))
+            lines.append("")
+
+        bot.reply_to(message, "\n".join(lines).strip(), parse_mode=CARD_PARSE_MODE)
+    except Exception as e:
+        logger.error(f"Ошибка истории цен: {e}")
+        bot.send_message(message.chat.id, f"Ошибка при запросе истории цен: {e}")
+
+
+# Подписки на скидки
+WATCH_CHECK_INTERVAL = 3600
+WATCH_THRESHOLD_PATTERN = re.compile(r'\s+(\d{1,3})\s*%$')
+
+watchlist = Watchlist('watchlist.json')
+notification_sender = RateLimitedSender(bot)
+
+
+def format_discount_notification(entry, price_overview):
+    """Текст уведомления о скидке для подписчика"""
+    return (f"🔥 *{escape_markdown(entry['name'])}* со скидкой {price_overview['discount_percent']}%\\!\n"
+            f"💰 {escape_markdown(price_overview.get('final_formatted', ''))} "
+            f"\\(регион {escape_markdown(entry['region'])}\\)\n\n"
+            f"[Открыть в Steam](https://store.steampowered.com/app/{entry['appid']})")
+
+
+discount_checker = DiscountChecker(steam_api, watchlist, notification_sender,
+                                   format_discount_notification, interval=WATCH_CHECK_INTERVAL,
+                                   parse_mode=CARD_PARSE_MODE)
+
+
+@bot.message_handler(commands=['watch'])
+def add_watch(message):
+    """Подписка на скидку: /watch название [скидка%]"""
+    try:
+        user = message.from_user
+        user_region = get_user_region(user.id, user.username)
+        game_name = message.text.partition(' ')[2].strip()
+
+        # Порог указывается со знаком %, чтобы не путать его с номером в названии (Dota 2)
+        threshold = 1
+        match = WATCH_THRESHOLD_PATTERN.search(game_name)
+        if match:
+            threshold = max(1, min(int(match.group(1)), 100))
+            game_name = game_name[:match.start()].strip()
+
+        if len(game_name) < 2:
+            bot.reply_to(message, "Использование: /watch название [скидка%]\nНапример: /watch Ведьмак 3 50%")
+            return
+
+        games = steam_api.smart_game_search(game_name, user_region)
+        if not games:
+            bot.reply_to(message, f"❌ {game_name} не найдена в регионе {user_region}")
+            return
+
+        game = games[0]
+        watchlist.add(user.id, message.chat.id, game['id'], user_region, threshold, game['name'])
+        logger.info(f"Пользователь {user.username} подписался на {game['id']} ({threshold}%)")
+
+        bot.reply_to(message, f"🔔 Сообщу, когда на {game['name']} в регионе {user_region} "
+                              f"будет скидка от {threshold}%\nСписок подписок: /watchlist")
+    except Exception as e:
+        logger.error(f"Ошибка подписки: {e}")
+        bot.send_message(message.chat.id, f"Ошибка при подписке: {e}")
+
+
+@bot.message_handler(commands=['watchlist'])
+def show_watchlist(message):
+    entries = watchlist.for_user(message.from_user.id)
+    if not entries:
+        bot.reply_to(message, "У вас нет подписок. Добавить: /watch название [скидка%]")
+        return
+
+    lines = ["🔔 Ваши подписки:"]
+    for i, entry in enumerate(entries, start=1):
+        lines.append(f"{i}. {entry['name']} ({entry['region']}) - от {entry['threshold']}%")
+    lines.append("\nУдалить: /unwatch номер")
+    bot.reply_to(message, "\n".join(lines))
+
+
+@bot.message_handler(commands=['unwatch'])
+def remove_watch(message):
+    entries = watchlist.for_user(message.from_user.id)
+    number = message.text.partition(' ')[2].strip()
+
+    if not number.isdigit() or not 1 <= int(number) <= len(entries):
+        bot.reply_to(message, "Использование: /unwatch номер из /watchlist")
+        return
+
+    entry = entries[int(number) - 1]
+    watchlist.remove(message.from_user.id, entry['appid'], entry['region'])
+    bot.reply_to(message, f"🔕 Подписка на {entry['name']} удалена")
+
+
+# Инлайн-режим: @bot название игры
+INLINE_PAGE_SIZE = 5
+INLINE_SEARCH_LIMIT = 25
+INLINE_CACHE_TIME = 300
+# Пустой ответ может означать сбой Steam, поэтому Telegram держит его недолго
+INLINE_EMPTY_CACHE_TIME = 10
+# Пауза после последнего символа, прежде чем идти в Steam
+INLINE_DEBOUNCE = 0.4
+
+inline_results = TTLCache(maxsize=1024, ttl=INLINE_CACHE_TIME)
+inline_pool = ThreadPoolExecutor(max_workers=INLINE_PAGE_SIZE)
+inline_timers = {}
+inline_timers_lock = threading.Lock()
+
+
+def build_inline_result(game, user_region):
+    """Результат инлайн-запроса: фото с карточкой, либо ссылка, если подробностей нет"""
+    details = steam_api.get_game_details(game['id'], user_region)
+
+    if details and details.get('header_image'):
+        return types.InlineQueryResultPhoto(
+            id=str(game['id']),
+            photo_url=details['header_image'],
+            thumbnail_url=game.get('tiny_image') or details['header_image'],
+            title=game['name'],
+            caption=steam_api.format_game_info(details, user_region, limit=CAPTION_LIMIT),
+            parse_mode=CARD_PARSE_MODE
+        )
+
+    if details:
+        text = steam_api.format_game_info(details, user_region, limit=MESSAGE_LIMIT)
+    else:
+        text = f"🎮 *{escape_markdown(game['name'])}*\n\n" \
+               f"[Открыть в Steam](https://store.steampowered.com/app/{game['id']})"
+    return types.InlineQueryResultArticle(
+        id=str(game['id']),
+        title=game['name'],
+        input_message_content=types.InputTextMessageContent(text, parse_mode=CARD_PARSE_MODE),
+        thumbnail_url=game.get('tiny_image')
+    )
+
+
+def answer_inline(inline_query):
+    """Отвечает на инлайн-запрос страницей результатов"""
+    try:
+        user = inline_query.from_user
+        user_region = get_user_region(user.id, user.username)
+        query = inline_query.query.strip()
+        cache_key = (query.lower(), user_region)
+
+        games = inline_results.get(cache_key)
+        if games is None:
+            logger.info(f"Инлайн-поиск {query} от {user.username} в регионе {user_region}")
+            games = steam_api.smart_game_search(query, user_region, limit=INLINE_SEARCH_LIMIT) or []
+            # Пустой результат не кешируем: ошибка Steam не должна прятать игры на несколько минут
+            if games:
+                inline_results.set(cache_key, games)
+
+        offset = int(inline_query.offset or 0)
+        page = games[offset:offset + INLINE_PAGE_SIZE]
+        results = list(inline_pool.map(lambda game: build_inline_result(game, user_region), page))
+        next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(games) else ''
+
+        # Результаты зависят от региона пользователя, поэтому кеш Telegram персональный
+        cache_time = INLINE_CACHE_TIME if games else INLINE_EMPTY_CACHE_TIME
+        bot.answer_inline_query(inline_query.id, results, cache_time=cache_time,
+                                is_personal=True, next_offset=next_offset)
+    except Exception as e:
+        logger.error(f"Inline query error: {e}")
+
+
+def answer_debounced(user_id, inline_query):
+    with inline_timers_lock:
+        # Сработавший таймер больше не нужен; более новый таймер пользователя не трогаем
+        if inline_timers.get(user_id) is threading.current_thread():
+            del inline_timers[user_id]
+    answer_inline(inline_query)
+
+
+@bot.inline_handler(func=lambda inline_query: len(inline_query.query.strip()) >= 2)
+def handle_inline_query(inline_query):
+    """Инлайн-поиск: следующие страницы и закешированные запросы отвечаются сразу,
+    новый текст ждет INLINE_DEBOUNCE, чтобы не искать на каждый набранный символ"""
+    user = inline_query.from_user
+    region = user_regions.get(str(user.id), {}).get('region', 'RU')
+    cached = (inline_query.query.strip().lower(), region) in inline_results
+
+    if inline_query.offset or cached or INLINE_DEBOUNCE <= 0:
+        answer_inline(inline_query)
+        return
+
+    timer = threading.Timer(INLINE_DEBOUNCE, answer_debounced, args=(user.id, inline_query))
+    with inline_timers_lock:
+        previous = inline_timers.get(user.id)
+        if previous:
+            previous.cancel()
+        inline_timers[user.id] = timer
+    timer.start()
+
+
+# 'fast' - облегченная отрисовка через Agg без seaborn, 'seaborn' - исходный вид с KDE
+CHART_RENDERER = 'seaborn'
+# Для 'fast': png, webp или svg (svg уходит документом - Telegram не принимает его как фото)
+CHART_FORMAT = 'png'
+
+
+def send_chart(chat_id, plot_buffer, caption):
+    if CHART_FORMAT == 'svg' and CHART_RENDERER == 'fast':
+        plot_buffer.name = 'chart.svg'
+        bot.send_document(chat_id, plot_buffer, caption=caption)
+    else:
+        bot.send_photo(chat_id, plot_buffer, caption=caption)
+
+
+def chart_options():
+    if CHART_RENDERER == 'fast':
+        return {'renderer': 'fast', 'image_format': CHART_FORMAT}
+    return {}
+
+
+def parse_chart_args(text):
+    """Аргументы графиков: число, флаг log и жанр из оставшихся слов"""
+    number, log_scale, genre_words = None, False, []
+    for word in text.split()[1:]:
+        if word.isdigit() and number is None:
+            number = int(word)
+        elif word.lower() in ('log', 'лог'):
+            log_scale = True
+        else:
+            genre_words.append(word)
+    return number, log_scale, " ".join(genre_words) or None
+
+
+@bot.message_handler(commands=['dataset'])
+def choose_dataset(message):
+    """Датасет чата: /dataset - список, /dataset имя - выбрать"""
+    try:
+        name = message.text.partition(' ')[2].strip()
+        names = datasets.names()
+        if not name:
+            current = get_chat_dataset(message.chat.id).name if names else None
+            lines = [f"{'✅' if item == current else '▫️'} {item}" for item in names]
+            bot.reply_to(message, "🗂 Датасеты:\n" + "\n".join(lines) + "\n\nВыбрать: /dataset имя"
+                         if names else "❌ Нет ни одного датасета")
+            return
+
+        if name not in datasets:
+            bot.reply_to(message, f"❌ Датасет {name} не найден. Доступны: {', '.join(names)}")
+            return
+
+        chat_datasets[str(message.chat.id)] = name
+        save_chat_datasets()
+        stats = get_dataset_stats(datasets.get(name))
+        logger.info(f"Пользователь {message.from_user.username} выбрал датасет {name}")
+        bot.reply_to(message, f"✅ Датасет {name}: игроков {stats['total_players']}, игр {stats['total_games']}")
+    except Exception as e:
+        logger.error(f"Ошибка выбора датасета {e}")
+        bot.send_message(message.chat.id, f"Ошибка при выборе датасета: {e}")
+
+
 @bot.message_handler(commands=['top_games'])
 def send_top_games(message):
+    """ТОП игр: /top_games [количество] [жанр]"""
     try:
-        bot.send_message(message.chat.id, "Создаю График...")
-        plot_buffer = create_top_games_plot(df)
+        dataset = get_chat_dataset(message.chat.id)
+        stats = get_dataset_stats(dataset)
+        top_n, _, genre = parse_chart_args(message.text)
+        plot_buffer = create_top_games_plot(dataset, top_n or 10, genre, **chart_options())
         logger.info(f"Пользователь {message.from_user.username} запросил топ игр среди друзей")
-        bot.send_photo(message.chat.id, plot_buffer, caption=f"Всего игр : {stats['total_games']}"
-                                                             f" Игроков : {stats['total_players']}")
+        send_chart(message.chat.id, plot_buffer, caption=f"Всего игр : {stats['total_games']}"
+                                                         f" Игроков : {stats['total_players']}")
+    except ValueError as e:
+        bot.send_message(message.chat.id, str(e))
     except Exception as e:
         logger.error(f"Ошибка отправления графика: {e}")
         bot.send_message(message.chat.id, f"Ошибка при создании графика: {e}")
 
 @bot.message_handler(commands=['playtime'])
 def senf_playtime_stats(message):
+    """Распределение времени: /playtime [столбцов] [жанр] [log]"""
     try:
-        bot.send_message(message.chat.id, "Анализирую время игры...")
-        plot_buffer = create_playtime_distribution(df)
+        dataset = get_chat_dataset(message.chat.id)
+        bins, log_scale, genre = parse_chart_args(message.text)
+        plot_buffer = create_playtime_distribution(dataset, bins or 20, genre, log_scale, **chart_options())
         logger.info(f"Пользователь {message.from_user.username} запросил время игры")
-        caption = f'Макс: {stats['max_playtime']:.0f}ч, Среднее: {stats['avg_playtime']:.0f}ч'
-        bot.send_photo(message.chat.id, plot_buffer, caption=caption)
+        if genre:
+            playtime = get_aggregates(dataset, 'playtime', normalize_genre(dataset, genre))
+            caption = f"{genre}: Макс: {playtime.max():.0f}ч, Среднее: {playtime.mean():.0f}ч"
+        else:
+            stats = get_dataset_stats(dataset)
+            caption = f"Макс: {stats['max_playtime']:.0f}ч, Среднее: {stats['avg_playtime']:.0f}ч"
+        send_chart(message.chat.id, plot_buffer, caption=caption)
+    except ValueError as e:
+        bot.send_message(message.chat.id, str(e))
     except Exception as e:
         logger.error(f"Ошибка отправления графика {e}")
         bot.send_message(message.chat.id, f"Ошибка при создании графика: {e}")
@@ -491,10 +967,11 @@ def senf_playtime_stats(message):
 @bot.message_handler(commands=['genres'])
 def send_genre_stats(message):
     try:
+        dataset = get_chat_dataset(message.chat.id)
         bot.send_message(message.chat.id, "Анализирую жанры...")
-        plot_buffer = create_genre_analysis(df)
+        plot_buffer = create_genre_analysis(dataset)
         logger.info(f"Пользователь {message.from_user.username} запросил жанры")
-        caption = f"Всего жанров: {stats['total_genres']}"
+        caption = f"Всего жанров: {get_dataset_stats(dataset)['total_genres']}"
         bot.send_photo(message.chat.id, plot_buffer, caption=caption)
 
     except Exception as e:
@@ -504,7 +981,8 @@ def send_genre_stats(message):
 @bot.message_handler(commands = ['correlation'])
 def send_correlation_stats(message):
     try:
-        correlation, strength, direction, group_stats = test_playtime_achievements_correlation(df)
+        correlation = get_dataset_stats(get_chat_dataset(message.chat.id))['correlation']
+        strength, direction = describe_correlation(correlation)
         if strength == 'очень слабая' or strength == 'слабая':
             results = ('Скорее всего достижения не зависят от времени\n'
                        'Другие факторы влияют сильнее')
@@ -519,10 +997,67 @@ def send_correlation_stats(message):
         logger.error(f"Ошибка при построении корреляции {e}")
         bot.send_message(message.chat.id, f"Ошибка при построении корреляции: {e}")
 
+PROFILE_ROWS = 15
+
+
+@bot.message_handler(commands=['player'])
+def send_player_stats(message):
+    """Игры друга: часы и процент достижений"""
+    try:
+        nick = message.text.partition(' ')[2].strip()
+        if not nick:
+            bot.reply_to(message, "Использование: /player ник")
+            return
+
+        games = get_player_stats(get_chat_dataset(message.chat.id), nick)
+        logger.info(f"Пользователь {message.from_user.username} запросил игрока {nick}")
+        if games is None:
+            bot.reply_to(message, f"❌ Игрок {nick} не найден")
+            return
+
+        lines = [f"👤 {games['Nick'].iloc[0]}: {len(games)} игр, {games['Playtime'].sum():.0f}ч, "
+                 f"достижения в среднем {games['Achievements'].mean():.1f}%", ""]
+        for row in games.head(PROFILE_ROWS).itertuples():
+            lines.append(f"🎮 {row.Game} ({row.Genre}) - {row.Playtime:.0f}ч, достижения {row.Achievements:.1f}%")
+        if len(games) > PROFILE_ROWS:
+            lines.append(f"...и еще {len(games) - PROFILE_ROWS}")
+        bot.reply_to(message, "\n".join(lines))
+    except Exception as e:
+        logger.error(f"Ошибка статистики игрока {e}")
+        bot.send_message(message.chat.id, f"Ошибка при запросе игрока: {e}")
+
+
+@bot.message_handler(commands=['game'])
+def send_game_players(message):
+    """Друзья, которые играют в игру"""
+    try:
+        game_name = message.text.partition(' ')[2].strip()
+        if len(game_name) < 2:
+            bot.reply_to(message, "Использование: /game название")
+            return
+
+        players = get_game_players(get_chat_dataset(message.chat.id), game_name)
+        logger.info(f"Пользователь {message.from_user.username} запросил игру {game_name}")
+        if players is None:
+            bot.reply_to(message, f"❌ Игра {game_name} не найдена у друзей")
+            return
+
+        lines = [f"🎮 {players['Game'].iloc[0]}: {len(players)} друзей, {players['Playtime'].sum():.0f}ч, "
+                 f"достижения в среднем {players['Achievements'].mean():.1f}%", ""]
+        for row in players.head(PROFILE_ROWS).itertuples():
+            lines.append(f"👤 {row.Nick} - {row.Playtime:.0f}ч, достижения {row.Achievements:.1f}%")
+        if len(players) > PROFILE_ROWS:
+            lines.append(f"...и еще {len(players) - PROFILE_ROWS}")
+        bot.reply_to(message, "\n".join(lines))
+    except Exception as e:
+        logger.error(f"Ошибка статистики игры {e}")
+        bot.send_message(message.chat.id, f"Ошибка при запросе игры: {e}")
+
+
 @bot.message_handler(commands = ['asymmetryc'])
 def send_asymmetryc_stats(message):
     try:
-        assym = test_playtime_is_assymetryc(df)
+        assym = get_dataset_stats(get_chat_dataset(message.chat.id))['skew']
         logger.info(f"Пользователь {message.from_user.username} запросил ассиметрию")
         if abs(assym) < 0.5:
             results = 'распределение близко к симметричному'
@@ -549,5 +1084,10 @@ def send_asymmetryc_stats(message):
 import atexit
 
 atexit.register(save_users)
+atexit.register(price_history.close)
 
-bot.polling(none_stop=True)
\ No newline at end of file
+# Запуск только при прямом вызове, чтобы бенчмарки могли импортировать обработчики
+if __name__ == '__main__':
+    notification_sender.start()
+    discount_checker.start()
+    bot.polling(none_stop=True)